@@ -0,0 +1,199 @@
+import hashlib
+
+
+def read_compact_size(buffer, offset):
+    prefix = buffer[offset]
+    if prefix < 0xfd:
+        return prefix, offset + 1
+    width = {0xfd: 2, 0xfe: 4, 0xff: 8}[prefix]
+    return int.from_bytes(buffer[offset + 1 : offset + 1 + width], byteorder='little'), offset + 1 + width
+
+
+def sha256d_views(*views):
+    first = hashlib.sha256()
+    for view in views:
+        first.update(view)
+    return hashlib.sha256(first.digest()).digest()
+
+
+class RawInput:
+    __slots__ = ("_buffer", "_start", "_script_start", "_script_end")
+
+    def __init__(self, buffer, start, script_start, script_end):
+        self._buffer = buffer
+        self._start = start
+        self._script_start = script_start
+        self._script_end = script_end
+
+    @property
+    def prev_txid(self):
+        # Stored little-endian on the wire; displayed reversed
+        return self._buffer[self._start : self._start + 32]
+
+    @property
+    def vout(self):
+        return int.from_bytes(self._buffer[self._start + 32 : self._start + 36], byteorder='little')
+
+    @property
+    def script_sig(self):
+        return self._buffer[self._script_start : self._script_end]
+
+    @property
+    def sequence(self):
+        return int.from_bytes(self._buffer[self._script_end : self._script_end + 4], byteorder='little')
+
+
+class RawOutput:
+    __slots__ = ("_buffer", "_start", "_script_start", "_script_end")
+
+    def __init__(self, buffer, start, script_start, script_end):
+        self._buffer = buffer
+        self._start = start
+        self._script_start = script_start
+        self._script_end = script_end
+
+    @property
+    def value(self):
+        return int.from_bytes(self._buffer[self._start : self._start + 8], byteorder='little')
+
+    @property
+    def script_pubkey(self):
+        return self._buffer[self._script_start : self._script_end]
+
+
+class RawTransaction:
+    """
+    A consensus-encoded transaction parsed in place from a buffer.
+
+    Parsing only records offsets; inputs, outputs and witness items are handed out as memoryview slices of
+    the original buffer, and txid/wtxid are hashed straight from those slices without re-serializing.
+    """
+
+    __slots__ = ("buffer", "is_segwit", "_inputs", "_outputs", "_witness_start", "_witness_offsets")
+
+    def __init__(self, buffer):
+        self.buffer = memoryview(buffer)
+        offset = 4
+        self.is_segwit = self.buffer[4] == 0 and self.buffer[5] != 0
+        if self.is_segwit:
+            offset += 2
+
+        self._inputs = []
+        count, offset = read_compact_size(self.buffer, offset)
+        for _ in range(count):
+            script_length, script_start = read_compact_size(self.buffer, offset + 36)
+            self._inputs.append((offset, script_start, script_start + script_length))
+            offset = script_start + script_length + 4
+
+        self._outputs = []
+        count, offset = read_compact_size(self.buffer, offset)
+        for _ in range(count):
+            script_length, script_start = read_compact_size(self.buffer, offset + 8)
+            self._outputs.append((offset, script_start, script_start + script_length))
+            offset = script_start + script_length
+
+        self._witness_start = offset
+        self._witness_offsets = []
+        if self.is_segwit:
+            for _ in range(len(self._inputs)):
+                stack = []
+                items, offset = read_compact_size(self.buffer, offset)
+                for _ in range(items):
+                    length, offset = read_compact_size(self.buffer, offset)
+                    stack.append((offset, offset + length))
+                    offset += length
+                self._witness_offsets.append(stack)
+
+        if offset + 4 != len(self.buffer):
+            raise ValueError("Trailing or missing bytes after transaction")
+
+    @classmethod
+    def from_hex(cls, hex_string):
+        return cls(bytes.fromhex(hex_string))
+
+    @property
+    def version(self):
+        return int.from_bytes(self.buffer[:4], byteorder='little')
+
+    @property
+    def locktime(self):
+        return int.from_bytes(self.buffer[-4:], byteorder='little')
+
+    @property
+    def inputs(self):
+        return [RawInput(self.buffer, *offsets) for offsets in self._inputs]
+
+    @property
+    def outputs(self):
+        return [RawOutput(self.buffer, *offsets) for offsets in self._outputs]
+
+    @property
+    def witnesses(self):
+        """
+        Return one list of memoryview witness items per input (empty lists for legacy transactions).
+        """
+        if not self.is_segwit:
+            return [[] for _ in self._inputs]
+        return [[self.buffer[start:end] for start, end in stack] for stack in self._witness_offsets]
+
+    def _stripped_views(self):
+        if not self.is_segwit:
+            return (self.buffer,)
+        return (self.buffer[:4], self.buffer[6 : self._witness_start], self.buffer[-4:])
+
+    @property
+    def txid(self):
+        return sha256d_views(*self._stripped_views())[::-1].hex()
+
+    @property
+    def wtxid(self):
+        return sha256d_views(self.buffer)[::-1].hex()
+
+    @property
+    def size(self):
+        return len(self.buffer)
+
+    @property
+    def weight(self):
+        stripped_size = sum(len(view) for view in self._stripped_views())
+        return stripped_size * 3 + len(self.buffer)
+
+    def to_dict(self):
+        """
+        Build the verbose dictionary form used by the rest of the pipeline.
+
+        Raw transactions carry no prevout data, so the result has no 'prevout' keys; fees must come from
+        elsewhere before the transaction can be pre-processed.
+        """
+        witnesses = self.witnesses
+        return {
+            "txid": self.txid,
+            "version": self.version,
+            "locktime": self.locktime,
+            "vin": [
+                {
+                    "txid": input.prev_txid[::-1].hex(),
+                    "vout": input.vout,
+                    "scriptsig": input.script_sig.hex(),
+                    "witness": [item.hex() for item in witness],
+                    "sequence": input.sequence,
+                }
+                for input, witness in zip(self.inputs, witnesses)
+            ],
+            "vout": [
+                {"value": output.value, "scriptpubkey": output.script_pubkey.hex()}
+                for output in self.outputs
+            ],
+            "weight": self.weight,
+        }
+
+
+def iter_raw_transactions(path):
+    """
+    Parse a dump of raw transactions, one hex-encoded transaction per line.
+    """
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield RawTransaction.from_hex(line)
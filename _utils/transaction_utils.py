@@ -1,4 +1,5 @@
 import hashlib
+from _utils.raw_transaction import sha256d_views
 
 def to_compact_size(value):
     if value < 0xfd:
@@ -57,8 +58,9 @@ def wtxid_serialize(txn_data):
     # Version
     transaction_hash += to_little_endian(data['version'], 4)
 
-    # Marker+flags (if any `vin` has empty scriptsig)
-    if any(input.get("scriptsig") == "" for input in data["vin"]):
+    # Marker+flags (if any `vin` carries witness data)
+    segwit = any(input.get("witness") for input in data["vin"])
+    if segwit:
         transaction_hash += "0001"
 
     # No. of inputs:
@@ -81,11 +83,12 @@ def wtxid_serialize(txn_data):
         transaction_hash += to_compact_size(len(output['scriptpubkey']) // 2)
         transaction_hash += output['scriptpubkey']
 
-    # Witness
-    for input in data["vin"]:
-        if "witness" in input and input["witness"]:
-            transaction_hash += to_compact_size(len(input['witness']))
-            for j in input["witness"]:
+    # Witness (one stack per input, empty stacks included)
+    if segwit:
+        for input in data["vin"]:
+            witness = input.get("witness") or []
+            transaction_hash += to_compact_size(len(witness))
+            for j in witness:
                 transaction_hash += to_compact_size(len(j) // 2)
                 transaction_hash += j
 
@@ -94,122 +97,118 @@ def wtxid_serialize(txn_data):
 
     return transaction_hash
 
-def serialize_coinbase_transaction(witness_commitment):
-    tx_dict = {
-        "version": "01000000",
-        "marker": "00",
-        "flag": "01",
-        "inputcount": "01",
-        "inputs": [
-            {
-                "txid": "0000000000000000000000000000000000000000000000000000000000000000",
-                "vout": "ffffffff",
-                "scriptsigsize": "25",
-                "scriptsig": "03233708184d696e656420627920416e74506f6f6c373946205b8160a4256c0000946e0100",
-                "sequence": "ffffffff",
-            }
-        ],
-        "outputcount": "02",
-        "outputs": [
-            {
-                "amount": "f595814a00000000",
-                "scriptpubkeysize": "19",
-                "scriptpubkey": "76a914edf10a7fac6b32e24daa5305c723f3de58db1bc888ac",
-            },
-            {
-                "amount": "0000000000000000",
-                "scriptpubkeysize": "26",
-                "scriptpubkey": f"6a24aa21a9ed{witness_commitment}",
-            },
-        ],
-        "witness": [
-            {
-                "stackitems": "01",
-                "0": {
-                    "size": "20",
-                    "item": "0000000000000000000000000000000000000000000000000000000000000000",
-                },
-            }
-        ],
-        "locktime": "00000000",
-    }
-    tx_dict_modified = {
-        "version": 1,
-        "marker": "00",
-        "flag": "01",
-        "inputcount": "01",
-        "vin": [
-            {
-                "txid": "0000000000000000000000000000000000000000000000000000000000000000",
-                "vout": int("ffffffff", 16),
-                "scriptsigsize": 37,
-                "scriptsig": "03233708184d696e656420627920416e74506f6f6c373946205b8160a4256c0000946e0100",
-                "sequence": int("ffffffff", 16),
-            }
-        ],
-        "outputcount": "02",
-        "vout": [
-            {
-                "value": 2753059167,
-                "scriptpubkeysize": "19",
-                "scriptpubkey": "76a914edf10a7fac6b32e24daa5305c723f3de58db1bc888ac",
-            },
-            {
-                "value": 0,
-                "scriptpubkeysize": "26",
-                "scriptpubkey": f"6a24aa21a9ed{witness_commitment}",
-            },
-        ],
-        "witness": [
-            {
-                "stackitems": "01",
-                "0": {
-                    "size": "20",
-                    "item": "0000000000000000000000000000000000000000000000000000000000000000",
-                },
-            }
-        ],
-        "locktime": 0,
-    }
-    # Version
-    serialized_tx = tx_dict["version"]
-
-    # Marker and Flag
-    serialized_tx += tx_dict["marker"] + tx_dict["flag"]
-
-    # Input Count
-    serialized_tx += tx_dict["inputcount"]
-
-    # Input
-    input_data = tx_dict["inputs"][0]
-    serialized_tx += input_data["txid"]
-    serialized_tx += input_data["vout"]
-    serialized_tx += input_data["scriptsigsize"].zfill(2)
-    serialized_tx += input_data["scriptsig"]
-    serialized_tx += input_data["sequence"]
-
-    # Output Count
-    serialized_tx += tx_dict["outputcount"]
-
-    # Outputs
-    for output in tx_dict["outputs"]:
-        serialized_tx += output["amount"].zfill(16)
-        serialized_tx += output["scriptpubkeysize"].zfill(2)
-        serialized_tx += output["scriptpubkey"]
-
-    # Witness
-    witness_data = tx_dict["witness"][0]
-    serialized_tx += witness_data["stackitems"]
-    serialized_tx += witness_data["0"]["size"].zfill(2)
-    serialized_tx += witness_data["0"]["item"]
-
-    # Locktime
-    serialized_tx += tx_dict["locktime"]
-
-    # Serialize the modified transaction dictionary
-    serialized_tx_modified = serialize_txn(tx_dict_modified)
-
-    # Compute the wtxid
-    wtxid = to_reverse_bytes_string(to_hash256(serialized_tx_modified))
-
-    return serialized_tx, wtxid
+def script_number_push(value):
+    # Minimal CScriptNum encoding, as BIP34 requires for the coinbase height
+    encoded = value.to_bytes((value.bit_length() + 7) // 8, byteorder='little')
+    if encoded and encoded[-1] & 0x80:
+        encoded += b"\x00"
+    return to_compact_size(len(encoded)) + encoded.hex()
+
+# Chain tip the bundled mempool snapshot was taken at (its highest height-based locktime)
+MEMPOOL_TIP_HEIGHT = 834637
+# The block being built extends that tip: its BIP34 push, subsidy and locktime finality all use this height
+COINBASE_HEIGHT = MEMPOOL_TIP_HEIGHT + 1
+# Coinbase layout: BIP34 height push + pool tag, then an extranonce slot at the end of the scriptsig
+COINBASE_POOL_TAG = "184d696e656420627920416e74506f6f6c373946205b8160a4"
+COINBASE_SCRIPTSIG_PREFIX = script_number_push(COINBASE_HEIGHT) + COINBASE_POOL_TAG
+COINBASE_EXTRANONCE = "256c0000946e0100"
+COINBASE_PAYOUT_SCRIPT = "76a914edf10a7fac6b32e24daa5305c723f3de58db1bc888ac"
+WITNESS_COMMITMENT_HEADER = "6a24aa21a9ed"
+
+def block_subsidy(height):
+    halvings = height // 210000
+    return 0 if halvings >= 64 else (50 * 100000000) >> halvings
+
+class CoinbaseTemplate:
+    """
+    A coinbase transaction compiled once into a byte layout with fixed offsets.
+
+    Each call to `serialize` copies the template and splices the reward, witness commitment and extranonce
+    into place, so rebuilding the coinbase for a new fee total or extranonce costs a copy and three slice
+    assignments. The txid is hashed from the non-witness slices of the same buffer.
+    """
+
+    def __init__(self, payout_script=COINBASE_PAYOUT_SCRIPT, scriptsig_prefix=COINBASE_SCRIPTSIG_PREFIX,
+                 extranonce_size=len(COINBASE_EXTRANONCE) // 2):
+        prefix = bytes.fromhex(scriptsig_prefix)
+        payout = bytes.fromhex(payout_script)
+        self.extranonce_size = extranonce_size
+
+        template = bytearray()
+        template += (1).to_bytes(4, byteorder='little')
+        template += b"\x00\x01"
+        template += b"\x01" + bytes(32) + b"\xff\xff\xff\xff"
+        template += bytes.fromhex(to_compact_size(len(prefix) + extranonce_size)) + prefix
+        self.extranonce_offset = len(template)
+        template += bytes(extranonce_size)
+        template += b"\xff\xff\xff\xff"
+
+        template += b"\x02"
+        self.value_offset = len(template)
+        template += bytes(8)
+        template += bytes.fromhex(to_compact_size(len(payout))) + payout
+        template += bytes(8) + b"\x26" + bytes.fromhex(WITNESS_COMMITMENT_HEADER)
+        self.commitment_offset = len(template)
+        template += bytes(32)
+
+        # Witness: one stack item, the 32-byte witness reserved value
+        self.witness_offset = len(template)
+        template += b"\x01\x20" + bytes(32)
+        template += bytes(4)
+        self._template = bytes(template)
+
+    def serialize(self, value, witness_commitment, extranonce=None):
+        """
+        :param value: Output value in satoshis (subsidy plus collected fees).
+        :param witness_commitment: The witness commitment in hexadecimal format.
+        :param extranonce: Optional extranonce bytes, at most `extranonce_size` long.
+        :return: The serialized coinbase transaction as bytes.
+        """
+        buffer = bytearray(self._template)
+        if extranonce is None:
+            extranonce = bytes.fromhex(COINBASE_EXTRANONCE)
+        if len(extranonce) > self.extranonce_size:
+            raise ValueError("Extranonce does not fit in the coinbase scriptsig")
+        buffer[self.extranonce_offset : self.extranonce_offset + len(extranonce)] = extranonce
+        buffer[self.value_offset : self.value_offset + 8] = value.to_bytes(8, byteorder='little')
+        buffer[self.commitment_offset : self.commitment_offset + 32] = bytes.fromhex(witness_commitment)
+        return bytes(buffer)
+
+    def split(self, value, witness_commitment):
+        """
+        Split the non-witness serialization around the extranonce slot (Stratum's coinb1/coinb2).
+
+        :return: A tuple of the bytes before and after the extranonce.
+        """
+        serialized = self.serialize(value, witness_commitment, bytes(self.extranonce_size))
+        stripped = serialized[:4] + serialized[6 : self.witness_offset] + serialized[-4:]
+        offset = self.extranonce_offset - 2
+        return stripped[:offset], stripped[offset + self.extranonce_size :]
+
+    def txid(self, serialized):
+        view = memoryview(serialized)
+        # Skip marker/flag and the witness section
+        return sha256d_views(view[:4], view[6 : self.witness_offset], view[-4:])[::-1].hex()
+
+COINBASE_TEMPLATE = CoinbaseTemplate()
+
+def serialize_coinbase_transaction(witness_commitment, reward=None, extranonce=None):
+    if reward is None:
+        reward = block_subsidy(COINBASE_HEIGHT)
+    serialized_tx = COINBASE_TEMPLATE.serialize(reward, witness_commitment, extranonce)
+    return serialized_tx.hex(), COINBASE_TEMPLATE.txid(serialized_tx)
+
+def transaction_weight_and_size(txn_dict):
+    base_size = len(serialize_txn(txn_dict)) // 2
+    total_size = base_size
+
+    # Marker, flag and one witness stack per input (empty stacks included)
+    if any(input.get("witness") for input in txn_dict["vin"]):
+        total_size += 2
+        for input in txn_dict["vin"]:
+            witness = input.get("witness") or []
+            total_size += len(to_compact_size(len(witness))) // 2
+            for item in witness:
+                total_size += len(to_compact_size(len(item) // 2)) // 2 + len(item) // 2
+
+    return base_size * 3 + total_size, total_size
@@ -0,0 +1,302 @@
+import heapq
+import time
+from _utils.transaction_utils import transaction_weight_and_size
+
+# Constants
+MAX_BLOCK_WEIGHT = 4000000
+RESERVED_WEIGHT = 4000  # header, transaction count and coinbase
+TEMPLATE_BUDGET_MS = 250
+SWAP_CANDIDATES = 32  # lowest-feerate packages tried for swapping out per pass
+KNAPSACK_ITEMS = 128  # highest-fee packages considered when filling leftover weight
+KNAPSACK_CELLS = 1024  # capacity resolution of the filling knapsack
+
+
+class BlockTemplateOptimizer:
+    """
+    Picks block transactions by ancestor-package feerate, then keeps improving the fee until a deadline.
+
+    The greedy pass is the usual mining-score selection: each candidate is valued together with its unselected
+    ancestors, and selecting a package lowers the package totals of its descendants. It leaves weight unused at
+    the tail, which the anytime phase works on: leftover weight is filled by a 0/1 knapsack over the packages
+    that still fit, and low-feerate packages are swapped out whenever refilling the space they free pays more.
+    Every intermediate template keeps parents with their children and never spends an outpoint twice, so the
+    best one so far can be returned whenever the budget runs out.
+    """
+
+    def __init__(self, transactions, max_weight=MAX_BLOCK_WEIGHT - RESERVED_WEIGHT):
+        """
+        :param transactions: Pre-processed transaction dictionaries ('txid', 'vin', 'vout', 'fee', optionally
+                             'weight'). Parents outside this list are assumed confirmed.
+        :param max_weight: Weight available to the selected transactions.
+        """
+        self.max_weight = max_weight
+        self.transactions = {}
+        self.fee = {}
+        self.weight = {}
+        self.parents = {}
+        self.children = {}
+        for tx in transactions:
+            txid = tx["txid"]
+            self.transactions[txid] = tx
+            self.fee[txid] = tx["fee"]
+            self.weight[txid] = tx.get("weight") or transaction_weight_and_size(tx)[0]
+            self.children[txid] = set()
+        for txid, tx in self.transactions.items():
+            self.parents[txid] = {input["txid"] for input in tx["vin"] if input["txid"] in self.transactions}
+            for parent in self.parents[txid]:
+                self.children[parent].add(txid)
+
+        self._ancestors = {}
+        self._descendants = {}
+        self.position = {txid: position for position, txid in enumerate(self.transactions)}
+        self.depth = {}
+        for txid in self.transactions:
+            self.depth[txid] = len(self.ancestors(txid))
+
+        self.selected = set()
+        self.spent = {}
+        self.total_fee = 0
+        self.total_weight = 0
+        self.greedy_fee = 0
+        self.greedy_weight = 0
+        self.greedy_ms = 0.0
+        self.elapsed_ms = 0.0
+        self.swaps = 0
+        self.fills = 0
+
+    def ancestors(self, txid):
+        if txid not in self._ancestors:
+            result = set()
+            for parent in self.parents[txid]:
+                result.add(parent)
+                result |= self.ancestors(parent)
+            self._ancestors[txid] = frozenset(result)
+        return self._ancestors[txid]
+
+    def descendants(self, txid):
+        if txid not in self._descendants:
+            result = set()
+            for child in self.children[txid]:
+                result.add(child)
+                result |= self.descendants(child)
+            self._descendants[txid] = frozenset(result)
+        return self._descendants[txid]
+
+    def package(self, txid):
+        """
+        Return the transaction and its ancestors not yet in the template, parents first.
+        """
+        package = [a for a in self.ancestors(txid) if a not in self.selected]
+        package.append(txid)
+        return sorted(package, key=self.depth.get)
+
+    def _conflicts(self, package):
+        # Members of one package can double-spend each other as well as the template
+        outpoints = set()
+        for txid in package:
+            for input in self.transactions[txid]["vin"]:
+                outpoint = (input["txid"], input["vout"])
+                if outpoint in outpoints or self.spent.get(outpoint, txid) != txid:
+                    return True
+                outpoints.add(outpoint)
+        return False
+
+    def _add(self, package):
+        for txid in package:
+            self.selected.add(txid)
+            for input in self.transactions[txid]["vin"]:
+                self.spent[(input["txid"], input["vout"])] = txid
+            self.total_fee += self.fee[txid]
+            self.total_weight += self.weight[txid]
+
+    def _remove(self, package):
+        for txid in package:
+            self.selected.discard(txid)
+            for input in self.transactions[txid]["vin"]:
+                del self.spent[(input["txid"], input["vout"])]
+            self.total_fee -= self.fee[txid]
+            self.total_weight -= self.weight[txid]
+
+    def greedy(self):
+        """
+        Select packages in descending ancestor feerate until nothing else fits.
+
+        :return: The total fee of the greedy template.
+        """
+        package_fee, package_weight, version = {}, {}, {}
+        heap = []
+        for txid in self.transactions:
+            package_fee[txid] = self.fee[txid] + sum(self.fee[a] for a in self.ancestors(txid))
+            package_weight[txid] = self.weight[txid] + sum(self.weight[a] for a in self.ancestors(txid))
+            version[txid] = 0
+            heap.append((-package_fee[txid] / package_weight[txid], self.position[txid], 0, txid))
+        heapq.heapify(heap)
+
+        while heap:
+            _, _, entry_version, txid = heapq.heappop(heap)
+            if txid in self.selected or version[txid] != entry_version:
+                continue
+            # Packages only grow relative to the space left, so a package that does not fit is dropped until
+            # one of its ancestors gets selected and refreshes it
+            if self.total_weight + package_weight[txid] > self.max_weight:
+                continue
+            package = self.package(txid)
+            if self._conflicts(package):
+                continue
+            self._add(package)
+            for added in package:
+                for descendant in self.descendants(added):
+                    if descendant in self.selected:
+                        continue
+                    package_fee[descendant] -= self.fee[added]
+                    package_weight[descendant] -= self.weight[added]
+                    version[descendant] += 1
+                    heapq.heappush(heap, (
+                        -package_fee[descendant] / package_weight[descendant], self.position[descendant],
+                        version[descendant], descendant,
+                    ))
+
+        self.greedy_fee, self.greedy_weight = self.total_fee, self.total_weight
+        return self.total_fee
+
+    @staticmethod
+    def _expired(deadline):
+        return deadline is not None and time.perf_counter() >= deadline
+
+    def _fill_candidates(self, capacity, excluded, deadline=None):
+        candidates = []
+        for txid in self.transactions:
+            if self._expired(deadline):
+                return None
+            if txid in self.selected or txid in excluded or self.weight[txid] > capacity:
+                continue
+            package = self.package(txid)
+            if any(t in excluded for t in package):
+                continue
+            weight = sum(self.weight[t] for t in package)
+            if weight <= capacity and not self._conflicts(package):
+                candidates.append((sum(self.fee[t] for t in package), weight, package))
+        candidates.sort(key=lambda candidate: -candidate[0])
+        return candidates[:KNAPSACK_ITEMS]
+
+    def fill(self, excluded=(), deadline=None):
+        """
+        Fill the unused weight with the set of fitting packages that pays the most (0/1 knapsack).
+
+        Weights are rounded up to the knapsack's capacity unit, so the chosen set always fits. Packages that
+        share ancestors are merged when applied, which only makes the result lighter.
+
+        :param excluded: Transactions that must not be added (e.g. ones just swapped out).
+        :param deadline: Optional `time.perf_counter()` value; the fill is abandoned, unchanged, once it passes.
+        :return: The fee added.
+        """
+        capacity = self.max_weight - self.total_weight
+        candidates = self._fill_candidates(capacity, set(excluded), deadline)
+        if not candidates:
+            return 0
+
+        unit = max(4, -(-capacity // KNAPSACK_CELLS))
+        cells = capacity // unit
+        best = [0] * (cells + 1)
+        taken = []
+        for fee, weight, _ in candidates:
+            if self._expired(deadline):
+                return 0
+            size = -(-weight // unit)
+            row = [False] * (cells + 1)
+            for c in range(cells, size - 1, -1):
+                value = best[c - size] + fee
+                if value > best[c]:
+                    best[c] = value
+                    row[c] = True
+            taken.append((size, row))
+
+        chosen = []
+        c = cells
+        for (size, row), candidate in zip(reversed(taken), reversed(candidates)):
+            if row[c]:
+                chosen.append(candidate[2])
+                c -= size
+
+        before = self.total_fee
+        for package in chosen:
+            package = [t for t in package if t not in self.selected]
+            if package and self.total_weight + sum(self.weight[t] for t in package) <= self.max_weight \
+                    and not self._conflicts(package):
+                self._add(package)
+        return self.total_fee - before
+
+    def _swap_out_candidates(self, deadline=None):
+        # A selected transaction leaves together with its selected descendants, keeping the template closed
+        packages = []
+        for txid in self.selected:
+            if self._expired(deadline):
+                return []
+            package = [txid] + [d for d in self.descendants(txid) if d in self.selected]
+            fee = sum(self.fee[t] for t in package)
+            weight = sum(self.weight[t] for t in package)
+            packages.append((fee / weight, self.position[txid], package))
+        return [package for _, _, package in heapq.nsmallest(SWAP_CANDIDATES, packages)]
+
+    def _try_swap(self, package, deadline=None):
+        fee, weight = self.total_fee, self.total_weight
+        before = set(self.selected)
+        self._remove(package)
+        self.fill(excluded=package, deadline=deadline)
+        if self.total_fee > fee:
+            return True
+        # Revert: drop what the fill added and restore the package
+        self._remove(self.selected - before)
+        self._add(sorted(package, key=self.depth.get))
+        if self.selected != before or (self.total_fee, self.total_weight) != (fee, weight):
+            raise RuntimeError("Reverting a template swap did not restore the previous template")
+        return False
+
+    def optimize(self, budget_ms=TEMPLATE_BUDGET_MS):
+        """
+        Build the greedy template, then improve it until the time budget is spent or no move helps.
+
+        The greedy pass always runs to completion, so a budget shorter than that pass is overrun by the rest of
+        it. After the greedy pass, the deadline is checked before every package and every knapsack row, and an
+        unfinished fill or swap is dropped. The budget is then overrun by one such step, plus reverting the swap,
+        plus ordering the final template. On a full mempool that comes to a few milliseconds.
+
+        :param budget_ms: Time budget in milliseconds, counted from the start of the greedy pass.
+        :return: The selected transaction dictionaries, parents before children.
+        """
+        started = time.perf_counter()
+        deadline = started + budget_ms / 1000
+        self.greedy()
+        self.greedy_ms = (time.perf_counter() - started) * 1000
+        if self.fill(deadline=deadline):
+            self.fills += 1
+
+        improved = True
+        while improved and not self._expired(deadline):
+            improved = False
+            for package in self._swap_out_candidates(deadline):
+                if self._expired(deadline):
+                    break
+                if self._try_swap(package, deadline):
+                    self.swaps += 1
+                    improved = True
+                    break
+
+        template = self.template()
+        self.elapsed_ms = (time.perf_counter() - started) * 1000
+        return template
+
+    def template(self):
+        order = sorted(self.selected, key=lambda txid: (self.depth[txid], self.position[txid]))
+        return [self.transactions[txid] for txid in order]
+
+    def report(self):
+        gained = self.total_fee - self.greedy_fee
+        # Only the time after the greedy pass went into the gain
+        improving_ms = self.elapsed_ms - self.greedy_ms
+        rate = gained / improving_ms if improving_ms > 0 else 0.0
+        return (
+            f"Template: greedy fee {self.greedy_fee} ({self.greedy_weight} WU) in {self.greedy_ms:.0f} ms, "
+            f"optimized fee {self.total_fee} ({self.total_weight} WU), +{gained} sats in {improving_ms:.0f} ms "
+            f"({rate:.2f} sats/ms, {self.swaps} swaps)"
+        )
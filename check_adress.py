@@ -1,7 +1,21 @@
 import os
 import json
 import hashlib
-import coincurve
+from functools import lru_cache
+
+# Bounds for the per-process key caches (exchange/consolidation wallets reuse a handful of keys)
+PUBKEY_CACHE_SIZE = 4096
+HASH160_CACHE_SIZE = 8192
+
+@lru_cache(maxsize=PUBKEY_CACHE_SIZE)
+def load_public_key(publicKey):
+    """
+    Parses (and decompresses) a hex public key once; repeated keys are served from the cache.
+    """
+    # Deferred so that importing this module does not pay for loading libsecp256k1
+    import coincurve
+
+    return coincurve.PublicKey(bytes.fromhex(publicKey))
 
 def validate_signature(signature, message, publicKey):
     """
@@ -9,8 +23,23 @@ def validate_signature(signature, message, publicKey):
     """
     b_sig = bytes.fromhex(signature)
     b_msg = bytes.fromhex(message)
-    b_pub = bytes.fromhex(publicKey)
-    return coincurve.verify_signature(b_sig, b_msg, b_pub)
+    return load_public_key(publicKey).verify(b_sig, b_msg)
+
+def key_cache_stats():
+    """
+    Reports hit/miss counts and hit rate for the public key and hash160 caches.
+    """
+    stats = {}
+    for name, cached in (("pubkey", load_public_key), ("hash160", to_hash160)):
+        info = cached.cache_info()
+        lookups = info.hits + info.misses
+        stats[name] = {
+            "hits": info.hits,
+            "misses": info.misses,
+            "size": info.currsize,
+            "hit_rate": info.hits / lookups if lookups else 0.0,
+        }
+    return stats
 
 def to_compact_size(value):
     """
@@ -31,12 +60,10 @@ def little_endian(num, size):
     """
     return num.to_bytes(size, byteorder="little").hex()
 
+@lru_cache(maxsize=HASH160_CACHE_SIZE)
 def to_hash160(hex_input):
-    sha = hashlib.sha256(bytes.fromhex(hex_input)).hexdigest()
-    hash_160 = hashlib.new("ripemd160")
-    hash_160.update(bytes.fromhex(sha))
-
-    return hash_160.hexdigest()
+    sha = hashlib.sha256(bytes.fromhex(hex_input)).digest()
+    return hashlib.new("ripemd160", sha).hexdigest()
 def p2pkh_segwit_txn_data(txn_id):
     """
     Constructs preimage data for a SegWit transaction.
@@ -118,8 +145,7 @@ def validate_p2pkh_txn(signature, public_key, scriptpubkey_asm, txn_data):
             stack.append(stack[-1])
 
         elif instruction == "OP_HASH160":
-            sha = hashlib.sha256(bytes.fromhex(stack[-1])).hexdigest()
-            hash_160 = hashlib.new("ripemd160", bytes.fromhex(sha)).hexdigest()
+            hash_160 = to_hash160(stack[-1])
             stack.pop(-1)
             stack.append(hash_160)
 
@@ -270,4 +296,90 @@ def validate_p2wpkh_txn(witness, wit_scriptpubkey_asm, txn_data):
         "OP_DUP", "OP_HASH160", "OP_PUSHBYTES_20", pkh, "OP_EQUALVERIFY", "OP_CHECKSIG"
     ]
     return validate_signature(wit_sig, txn_data, wit_pubkey) and \
-           validate_p2pkh_txn(wit_sig, wit_pubkey, scriptpubkey_asm, txn_data)
\ No newline at end of file
+           validate_p2pkh_txn(wit_sig, wit_pubkey, scriptpubkey_asm, txn_data)
+def legacy_sighash_preimage(transaction, index):
+    """
+    Builds the SIGHASH_ALL preimage (without the sighash type) for a legacy input.
+    Only the input being signed carries the previous output's script; every other script is emptied.
+    """
+    preimage = little_endian(transaction['version'], 4) + to_compact_size(len(transaction['vin']))
+    for position, iN in enumerate(transaction['vin']):
+        script = iN['prevout']['scriptpubkey'] if position == index else ""
+        preimage += bytes.fromhex(iN['txid'])[::-1].hex() + little_endian(iN['vout'], 4)
+        preimage += to_compact_size(len(script) // 2) + script + little_endian(iN['sequence'], 4)
+    preimage += to_compact_size(len(transaction['vout']))
+    for out in transaction['vout']:
+        preimage += little_endian(out['value'], 8) + to_compact_size(len(out['scriptpubkey']) // 2) + out['scriptpubkey']
+    return preimage + little_endian(transaction['locktime'], 4)
+
+def segwit_sighash_preimage(transaction, index, pkh):
+    """
+    Builds the BIP143 SIGHASH_ALL preimage (without the sighash type) for a P2WPKH input.
+    """
+    def hash256_hex(data):
+        return hashlib.sha256(hashlib.sha256(bytes.fromhex(data)).digest()).digest().hex()
+
+    vin = transaction['vin']
+    hash256_in = hash256_hex(''.join(bytes.fromhex(iN['txid'])[::-1].hex() + little_endian(iN['vout'], 4) for iN in vin))
+    hash256_seq = hash256_hex(''.join(little_endian(iN['sequence'], 4) for iN in vin))
+    hash256_out = hash256_hex(''.join(
+        little_endian(out['value'], 8) + to_compact_size(len(out['scriptpubkey']) // 2) + out['scriptpubkey']
+        for out in transaction['vout']
+    ))
+    iN = vin[index]
+    return (
+        little_endian(transaction['version'], 4) + hash256_in + hash256_seq
+        + bytes.fromhex(iN['txid'])[::-1].hex() + little_endian(iN['vout'], 4)
+        + f"1976a914{pkh}88ac" + little_endian(iN['prevout']['value'], 8) + little_endian(iN['sequence'], 4)
+        + hash256_out + little_endian(transaction['locktime'], 4)
+    )
+
+def scriptsig_pushes(scriptsig):
+    """
+    Splits a scriptSig made only of direct pushes into its pushed items (hex), or returns None.
+    """
+    items = []
+    offset = 0
+    while offset < len(scriptsig):
+        length = int(scriptsig[offset:offset + 2], 16)
+        if not 0 < length <= 0x4b or offset + 2 + length * 2 > len(scriptsig):
+            return None
+        items.append(scriptsig[offset + 2:offset + 2 + length * 2])
+        offset += 2 + length * 2
+    return items
+
+def validate_input(transaction, index):
+    """
+    Validates one input of a transaction dictionary (with prevouts) using the script validators above.
+    Returns True or False for the P2PKH, P2WPKH and P2SH-P2WPKH SIGHASH_ALL spends it understands, and None
+    for every other input, which is left unchecked. Only the raw scripts are read, so prevouts resolved from
+    a UTXO store (which carry no asm) validate the same way as the explorer's.
+    """
+    iN = transaction['vin'][index]
+    prevout = iN['prevout']
+    script = prevout['scriptpubkey']
+    script_type = prevout.get('scriptpubkey_type')
+    pkh = None
+    if script_type == 'p2pkh':
+        items = scriptsig_pushes(iN.get('scriptsig', ''))
+        if items is None or len(items) != 2 or items[0][-2:] != "01":
+            return None
+        signature, public_key = items
+        scriptpubkey_asm = ["OP_DUP", "OP_HASH160", "OP_PUSHBYTES_20", script[6:46], "OP_EQUALVERIFY", "OP_CHECKSIG"]
+        return validate_p2pkh_txn(signature, public_key, scriptpubkey_asm,
+                                  legacy_sighash_preimage(transaction, index)) is True
+    if script_type == 'v0_p2wpkh':
+        pkh = script[4:]
+    elif script_type == 'p2sh':
+        items = scriptsig_pushes(iN.get('scriptsig', ''))
+        if items is None or len(items) != 1 or len(items[0]) != 44 or not items[0].startswith("0014"):
+            return None
+        pkh = items[0][4:]
+        if not validate_p2sh_txn_basic(f"OP_0 OP_PUSHBYTES_20 {pkh}", f"OP_HASH160 OP_PUSHBYTES_20 {script[4:44]} OP_EQUAL"):
+            return False
+    witness = iN.get('witness') or []
+    if pkh is None or len(witness) != 2 or witness[0][-2:] != "01":
+        return None
+    scriptpubkey_asm = ["OP_DUP", "OP_HASH160", "OP_PUSHBYTES_20", pkh, "OP_EQUALVERIFY", "OP_CHECKSIG"]
+    return validate_p2pkh_txn(witness[0], witness[1], scriptpubkey_asm,
+                              segwit_sighash_preimage(transaction, index, pkh)) is True
@@ -0,0 +1,255 @@
+import time
+
+_CLI_STARTED = time.perf_counter()
+
+import argparse
+import os
+import sys
+
+# Budget (ms) from CLI start to the point where a subcommand's work begins
+STARTUP_BUDGET_MS = 50
+
+
+def load_ingest(args):
+    import main
+    return main
+
+
+def run_ingest(args, main):
+    try:
+        mempool = main.load_mempool(args.rpc, args.policy, args.utxo)
+    except ValueError as e:
+        print(f"Cannot ingest: {e}")
+        return 1
+    print(f"Resident: {len(mempool)}, weight {mempool.total_weight} ({(mempool.total_weight + 3) // 4} vB)")
+    print(f"Evicted: {mempool.evicted}, replaced: {mempool.replaced}, rejected: {dict(mempool.rejected)}")
+    return 0
+
+
+def load_select(args):
+    import main
+    return main
+
+
+def run_select(args, main):
+    try:
+        transactions = main.select_block_transactions(args.rpc, args.policy, args.budget, args.utxo)
+    except ValueError as e:
+        print(f"Cannot select: {e}")
+        return 1
+    print(f"Total fee: {sum(tx['fee'] for tx in transactions)}")
+    if args.output:
+        with open(args.output, "w") as f:
+            f.writelines(f"{tx['txid']}\n" for tx in transactions)
+    return 0
+
+
+def load_mine(args):
+    import main
+    return main
+
+
+def run_mine(args, main):
+    try:
+        main.main(args.rpc, args.policy, args.utxo)
+    except ValueError as e:
+        print(f"Cannot mine: {e}")
+        return 1
+    return 0
+
+
+def load_verify(args):
+    # Header and merkle checks only need the hashing helpers, not the process pool
+    if args.header or args.merkle:
+        import mine_block_script
+        return mine_block_script
+    import verify_block
+    return verify_block
+
+
+def run_verify(args, module):
+    if args.header:
+        try:
+            module.validate_header(args.header, module.DIFFICULTY_TARGET)
+        except ValueError as e:
+            print(f"Header is invalid: {e}")
+            return 1
+        print("Header meets the difficulty target")
+        return 0
+    if args.merkle:
+        with open(args.merkle, "r") as f:
+            txids = [line.strip() for line in f if line.strip()]
+        print(module.calculate_merkle_root(txids))
+        return 0
+    return module.main(args.paths)
+
+
+def load_validate(args):
+    import main
+    import validation_scheduler
+    return main, validation_scheduler
+
+
+def run_validate(args, modules):
+    main, validation_scheduler = modules
+    transactions = [main.preprocess_transaction(tx) for tx in main.iter_source_transactions(args.rpc)]
+    scheduler = validation_scheduler.ValidationScheduler(args.workers)
+    valid = scheduler.run(transactions)
+    print(scheduler.report())
+    if args.output:
+        with open(args.output, "w") as f:
+            f.writelines(f"{tx['txid']}\n" for tx in valid)
+    return 0
+
+
+def load_utxo(args):
+    import main
+    import utxo_store
+    return main, utxo_store
+
+
+def run_utxo(args, modules):
+    main, utxo_store = modules
+    # Only an import may create the database; apply and undo need an existing store
+    try:
+        store = utxo_store.UTXOStore(args.db, create=args.action == "import")
+    except ValueError as e:
+        print(f"Cannot {args.action}: {e}")
+        return 1
+    with store:
+        if args.action == "import":
+            height = args.height if args.height is not None else utxo_store.MEMPOOL_TIP_HEIGHT
+            count = store.import_prevouts(list(main.iter_source_transactions(args.rpc)), height)
+            print(f"Imported {count} coins at height {height}")
+        elif args.action == "apply":
+            try:
+                block = utxo_store.read_block_transactions(args.block, list(main.iter_source_transactions(args.rpc)))
+                height = store.apply_block(block)
+            except ValueError as e:
+                print(f"Cannot apply {args.block}: {e}")
+                return 1
+            print(f"Applied {args.block} ({len(block)} transactions) at height {height}")
+        elif args.action == "undo":
+            try:
+                height = store.undo_block()
+            except ValueError as e:
+                print(f"Cannot undo: {e}")
+                return 1
+            print(f"Rolled back to height {height}")
+        print(f"Coins: {len(store)}, tip: {store.tip}")
+    return 0
+
+
+def load_bench(args):
+    import hashlib
+    import json
+    import check_adress
+    import mine_block_script
+    from _utils import transaction_utils
+    return hashlib, json, check_adress, mine_block_script, transaction_utils
+
+
+def run_bench(args, modules):
+    hashlib, json, check_adress, mine_block_script, transaction_utils = modules
+    names = sorted(os.listdir(mine_block_script.MEMPOOL_DIR))[: args.transactions]
+    raw = []
+    for name in names:
+        with open(os.path.join(mine_block_script.MEMPOOL_DIR, name), "r") as f:
+            raw.append(f.read())
+
+    def stage(label, count, work):
+        started = time.perf_counter()
+        result = work()
+        elapsed = (time.perf_counter() - started) * 1000
+        print(f"{label:<12} {elapsed:9.2f} ms  ({count} items, {elapsed * 1000 / max(count, 1):.2f} us/item)")
+        return result
+
+    transactions = stage("decode", len(raw), lambda: [json.loads(text) for text in raw])
+    transactions = stage("preprocess", len(transactions),
+                         lambda: [mine_block_script.preprocess_transaction(tx) for tx in transactions])
+    inputs = [(tx, index) for tx in transactions for index in range(len(tx["vin"]))]
+    stage("signatures", len(inputs), lambda: [check_adress.validate_input(tx, index) for tx, index in inputs])
+    for name, stats in check_adress.key_cache_stats().items():
+        print(f"{name + ' cache':<12} {stats['hits']} hits / {stats['misses']} misses ({stats['hit_rate']:.0%})")
+    txids = [tx["txid"] for tx in transactions]
+    stage("merkle", len(txids), lambda: mine_block_script.calculate_merkle_root(txids))
+    stage("witness", len(txids), lambda: mine_block_script.calculate_witness_root(transactions))
+    stage("coinbase", args.iterations,
+          lambda: [transaction_utils.serialize_coinbase_transaction("00" * 32, n) for n in range(args.iterations)])
+    header = bytes(76)
+    stage("header hash", args.iterations, lambda: [
+        hashlib.sha256(hashlib.sha256(header + n.to_bytes(4, "little")).digest()).digest()
+        for n in range(args.iterations)
+    ])
+    return 0
+
+
+COMMANDS = {
+    "ingest": (load_ingest, run_ingest, "Load the mempool and report admission statistics"),
+    "select": (load_select, run_select, "Pick the block template transactions"),
+    "mine": (load_mine, run_mine, "Select, mine and write output.txt (same as main.py)"),
+    "verify": (load_verify, run_verify, "Verify output.txt, a single header, or a merkle root"),
+    "validate": (load_validate, run_validate, "Check every transaction on a worker pool, parents first"),
+    "utxo": (load_utxo, run_utxo, "Import, inspect, apply blocks to or roll back the local UTXO store"),
+    "bench": (load_bench, run_bench, "Time the main pipeline stages"),
+}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="cli.py", description="Mine Your First Block tooling")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    for name, (_, _, help_text) in COMMANDS.items():
+        subcommand = subcommands.add_parser(name, help=help_text)
+        if name in ("ingest", "select", "mine", "validate", "utxo"):
+            subcommand.add_argument("--rpc", default=os.environ.get("MEMPOOL_RPC"),
+                                    help="host:port of a JSON-RPC node to ingest from")
+        if name in ("ingest", "select", "mine"):
+            subcommand.add_argument("--policy", action="store_true",
+                                    help="drop low-fee, dust, non-final and oversized transactions up front (NumPy)")
+            subcommand.add_argument("--utxo", help="UTXO store database to resolve and check prevouts against")
+        if name == "select":
+            subcommand.add_argument("--output", help="write the selected txids to this file")
+            subcommand.add_argument("--budget", type=float, default=250,
+                                    help="milliseconds the template optimizer may spend past greedy selection")
+        if name == "validate":
+            subcommand.add_argument("--workers", type=int, help="worker processes (default: CPU count)")
+            subcommand.add_argument("--output", help="write the txids that passed to this file")
+        if name == "verify":
+            subcommand.add_argument("paths", nargs="*", help="output files to verify (default: output.txt)")
+            subcommand.add_argument("--header", help="only check this 80-byte header (hex) against the target")
+            subcommand.add_argument("--merkle", help="only print the merkle root of the txids in this file")
+        if name == "utxo":
+            subcommand.add_argument("action", choices=("import", "stats", "apply", "undo"))
+            subcommand.add_argument("--db", default="utxo.sqlite", help="UTXO store database")
+            subcommand.add_argument("--height", type=int,
+                                    help="height of the imported snapshot (default: the bundled mempool's tip)")
+            subcommand.add_argument("--block", default="output.txt", help="mined block to apply")
+        if name == "bench":
+            subcommand.add_argument("--transactions", type=int, default=2000)
+            subcommand.add_argument("--iterations", type=int, default=10000)
+    return parser
+
+
+def main(argv=None, started=None):
+    """
+    :param argv: Command-line arguments (defaults to sys.argv[1:]).
+    :param started: perf_counter() value to measure start-up from (defaults to now).
+    :return: The process exit status.
+    """
+    started = started if started is not None else time.perf_counter()
+    args = build_parser().parse_args(argv)
+    load, run, _ = COMMANDS[args.command]
+
+    modules = load(args)
+    startup_ms = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    status = run(args, modules)
+    run_ms = (time.perf_counter() - started) * 1000
+
+    over_budget = " (over budget)" if startup_ms > STARTUP_BUDGET_MS else ""
+    print(f"[{args.command}] startup {startup_ms:.1f} ms{over_budget}, run {run_ms:.1f} ms", file=sys.stderr)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main(started=_CLI_STARTED))
@@ -1,6 +1,10 @@
 import json
 import os
+from collections import Counter
+from contextlib import ExitStack
 from mine_block_script import preprocess_transaction, mine_block_with_transactions, calculate_block_weight_and_fee
+from mempool_store import Mempool
+from block_template import BlockTemplateOptimizer, TEMPLATE_BUDGET_MS
 
 # Constants
 MEMPOOL_DIR = "mempool"
@@ -10,51 +14,129 @@ BLOCK_VERSION = 4  # Update to the correct block version
 # Define the witness reserved value
 WITNESS_RESERVED_VALUE = '0000000000000000000000000000000000000000000000000000000000000000'
 WTXID_COINBASE = bytes(32).hex()
+MEMPOOL_MAX_WEIGHT = 300 * 4000000  # Roughly 300 blocks worth of transactions
 
 
-def main():
-    # Read transaction files
-    transactions = []
+def iter_source_transactions(rpc_address=None):
+    """
+    Yield raw transaction dictionaries from a JSON-RPC node, the cache file or the mempool directory.
+
+    Files are read one at a time so that only transactions admitted to the mempool stay resident.
+
+    :param rpc_address: Optional "host:port" of a node (or the `mempool_rpc` stand-in) to fetch from.
+    """
+    if rpc_address:
+        # Deferred: asyncio is only worth importing when a node is actually queried
+        from mempool_rpc import DEFAULT_RPC_HOST, fetch_rpc_transactions
+
+        host, _, port = rpc_address.rpartition(":")
+        yield from fetch_rpc_transactions(host or DEFAULT_RPC_HOST, int(port))
+        return
 
     # Prefer cache when available, otherwise read from mempool directory
     cache_path = "valid_txn_cache.json"
     if os.path.exists(cache_path):
         with open(cache_path, "r") as file:
-            unverified_txns = json.load(file)
-        source_iter = unverified_txns
-    else:
-        filenames = [f for f in os.listdir(MEMPOOL_DIR) if f.endswith('.json')]
-        filenames.sort()
-        source_iter = []
-        for name in filenames:
-            path = os.path.join(MEMPOOL_DIR, name)
-            try:
-                with open(path, "r") as f:
-                    source_iter.append(json.load(f))
-            except Exception:
-                continue
-
-    for tx in source_iter[:2150]:
-        verified_tx = preprocess_transaction(tx)
-        transactions.append(verified_tx)
+            yield from json.load(file)
+        return
+
+    filenames = [f for f in os.listdir(MEMPOOL_DIR) if f.endswith('.json')]
+    filenames.sort()
+    for name in filenames:
+        path = os.path.join(MEMPOOL_DIR, name)
+        try:
+            with open(path, "r") as f:
+                yield json.load(f)
+        except Exception:
+            continue
+
+
+def load_mempool(rpc_address=None, policy=False, utxo_path=None):
+    """
+    Stream the source transactions through the optional checks into a bounded mempool.
+
+    :param rpc_address: Optional "host:port" of a JSON-RPC node to ingest from.
+    :param policy: Run the vectorized numeric policy pre-filter (requires NumPy) before admission.
+    :param utxo_path: Optional UTXO store database to resolve and check every input's prevout against.
+    :return: The populated Mempool.
+    :raises ValueError: If the UTXO store does not exist or is empty.
+    """
+    with ExitStack() as stack:
+        source = iter_source_transactions(rpc_address)
+        if utxo_path:
+            from utxo_store import UTXOStore, iter_resolved_prevouts
+
+            # The store stays open while the source streams through it chunk by chunk
+            store = stack.enter_context(UTXOStore(utxo_path, create=False))
+            if store.tip is None:
+                raise ValueError(f"UTXO store {utxo_path} is empty (seed it with `cli.py utxo import`)")
+            utxo_rejected = Counter()
+            source = iter_resolved_prevouts(source, store, rejected=utxo_rejected)
+        if policy:
+            from policy_filter import iter_policy_filtered
+
+            policy_rejected, policy_dropped = Counter(), set()
+            source = iter_policy_filtered(source, rejected=policy_rejected, dropped=policy_dropped)
+
+        # Admit transactions into a bounded mempool
+        mempool = Mempool(max_weight=MEMPOOL_MAX_WEIGHT)
+        for tx in source:
+            mempool.add(preprocess_transaction(tx))
+
+    if utxo_path:
+        print(f"UTXO store rejected: {dict(utxo_rejected)}")
+    if policy:
+        # Children streamed in before their filtered parent spend outputs that will never exist
+        orphans = [
+            tx["txid"] for tx in mempool.transactions() if any(input["txid"] in policy_dropped for input in tx["vin"])
+        ]
+        for txid in orphans:
+            policy_rejected["rejected-parent"] += len(mempool.remove(txid))
+        print(f"Policy filter rejected: {dict(policy_rejected)}")
+    return mempool
+
+
+def select_block_transactions(rpc_address=None, policy=False, budget_ms=TEMPLATE_BUDGET_MS, utxo_path=None):
+    """
+    Load the mempool and pick the transactions for the next block template.
+
+    :param rpc_address: Optional "host:port" of a JSON-RPC node to ingest from.
+    :param policy: Run the vectorized numeric policy pre-filter (requires NumPy) before admission.
+    :param budget_ms: Time the template optimizer may spend improving on the greedy selection.
+    :param utxo_path: Optional UTXO store database to resolve and check every input's prevout against.
+    :return: A list of pre-processed transaction dictionaries, parents before children.
+    :raises ValueError: If no transaction could be selected.
+    """
+    mempool = load_mempool(rpc_address, policy, utxo_path)
+    print(f"Mempool: {len(mempool)} resident, {mempool.evicted} evicted, {mempool.replaced} replaced")
+    optimizer = BlockTemplateOptimizer(mempool.transactions())
+    transactions = optimizer.optimize(budget_ms)
+    print(optimizer.report())
 
     print(f"Total transactions: {len(transactions)}")
 
     if not any(transactions):
         raise ValueError("No valid transactions to include in the block")
+    return transactions
 
-    # Mine the block
-    block_header, txids, nonce, coinbase_tx_hex, coinbase_txid = mine_block_with_transactions(transactions)
 
-    # Corrected writing to output file
-    with open(OUTPUT_FILE, "w") as file:
+def write_block(block_header, coinbase_tx_hex, coinbase_txid, txids, path=OUTPUT_FILE):
+    with open(path, "w") as file:
         file.write(f"{block_header}\n{coinbase_tx_hex}\n{coinbase_txid}\n")
         file.writelines(f"{txid}\n" for txid in txids)
 
+
+def main(rpc_address=None, policy=False, utxo_path=None):
+    transactions = select_block_transactions(rpc_address, policy, utxo_path=utxo_path)
+
+    # Mine the block
+    block_header, txids, nonce, coinbase_tx_hex, coinbase_txid = mine_block_with_transactions(transactions)
+    write_block(block_header, coinbase_tx_hex, coinbase_txid, txids)
+
     # Print the total weight and fee of the transactions in the block
     total_weight, total_fee = calculate_block_weight_and_fee(transactions)
     print(f"Total weight: {total_weight}")
     print(f"Total fee: {total_fee}")
 
 if __name__ == "__main__":
-    main()
+    main(os.environ.get("MEMPOOL_RPC"))
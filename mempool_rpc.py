@@ -0,0 +1,318 @@
+import asyncio
+import json
+import os
+from contextlib import asynccontextmanager
+from _utils.hash_utils import hash256
+from _utils.transaction_utils import to_reverse_bytes_string, serialize_txn
+
+# Constants
+MEMPOOL_DIR = "mempool"
+DEFAULT_RPC_HOST = "127.0.0.1"
+DEFAULT_RPC_PORT = 18443
+RPC_METHODS = ("getrawmempool", "getrawtransaction")
+RPC_ERROR_METHOD_NOT_FOUND = -32601
+RPC_ERROR_INVALID_PARAMETER = -8
+RPC_ERROR_INVALID_ADDRESS_OR_KEY = -5
+RPC_ERROR_PARSE = -32700
+RPC_ERROR_INVALID_REQUEST = -32600
+
+
+async def read_http_message(reader):
+    """
+    Read one HTTP/1.1 message (request or response) with a Content-Length body.
+
+    :param reader: The asyncio stream to read from.
+    :return: A tuple of the start line, a dictionary of lower-cased headers and the body bytes,
+             or None if the peer closed the connection before sending anything.
+    """
+    start_line = await reader.readline()
+    if not start_line:
+        return None
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    body = await reader.readexactly(int(headers.get("content-length", 0)))
+    return start_line.decode("latin-1").strip(), headers, body
+
+
+class MempoolRPCServer:
+    """
+    A local stand-in for a node's JSON-RPC interface, serving the files in the mempool directory.
+
+    Supports `getrawmempool` and verbose `getrawtransaction`, single or batched, over keep-alive HTTP
+    connections. The directory is re-listed on every `getrawmempool`, so files dropped in while the server
+    runs show up on the next poll.
+    """
+
+    def __init__(self, mempool_dir=MEMPOOL_DIR, host=DEFAULT_RPC_HOST, port=0):
+        self.mempool_dir = mempool_dir
+        self.host = host
+        self.port = port
+        self.connections_accepted = 0
+        self.requests_served = 0
+        self._indexed = {}
+        self._paths = {}
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def getrawmempool(self):
+        # File names are not txids, so new files are read once to learn their txid
+        names = {name for name in os.listdir(self.mempool_dir) if name.endswith(".json")}
+        for name in sorted(names - self._indexed.keys()):
+            try:
+                with open(os.path.join(self.mempool_dir, name), "r") as f:
+                    transaction = json.load(f)
+            except (OSError, ValueError):
+                continue
+            self._indexed[name] = to_reverse_bytes_string(hash256(serialize_txn(transaction)))
+        for name in self._indexed.keys() - names:
+            del self._indexed[name]
+        self._paths = {txid: name for name, txid in self._indexed.items()}
+        return [self._indexed[name] for name in sorted(self._indexed)]
+
+    def getrawtransaction(self, txid, verbose=True):
+        if not verbose:
+            raise ValueError((RPC_ERROR_INVALID_PARAMETER, "Only verbose output is available"))
+        try:
+            with open(os.path.join(self.mempool_dir, self._paths[txid]), "r") as f:
+                transaction = json.load(f)
+        except (KeyError, OSError, ValueError):
+            raise ValueError((RPC_ERROR_INVALID_ADDRESS_OR_KEY, "No such mempool transaction"))
+        transaction["txid"] = txid
+        return transaction
+
+    def _dispatch(self, call):
+        if not isinstance(call, dict):
+            error = {"code": RPC_ERROR_INVALID_REQUEST, "message": "Invalid request"}
+            return {"result": None, "error": error, "id": None}
+        if call.get("method") not in RPC_METHODS:
+            error = {"code": RPC_ERROR_METHOD_NOT_FOUND, "message": "Method not found"}
+            return {"result": None, "error": error, "id": call.get("id")}
+        params = call.get("params", [])
+        try:
+            if not isinstance(params, list):
+                raise TypeError
+            result = getattr(self, call["method"])(*params)
+        except TypeError:
+            error = {"code": RPC_ERROR_INVALID_PARAMETER, "message": "Invalid parameters"}
+            return {"result": None, "error": error, "id": call.get("id")}
+        except ValueError as e:
+            code, message = e.args[0]
+            return {"result": None, "error": {"code": code, "message": message}, "id": call.get("id")}
+        return {"result": result, "error": None, "id": call.get("id")}
+
+    def _respond(self, body):
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return {"result": None, "error": {"code": RPC_ERROR_PARSE, "message": "Parse error"}, "id": None}
+        if isinstance(payload, list):
+            self.requests_served += len(payload)
+            return [self._dispatch(call) for call in payload]
+        self.requests_served += 1
+        return self._dispatch(payload)
+
+    async def _handle_connection(self, reader, writer):
+        self.connections_accepted += 1
+        try:
+            while True:
+                message = await read_http_message(reader)
+                if message is None:
+                    break
+                _, headers, body = message
+                response = self._respond(body)
+
+                data = json.dumps(response).encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    + f"Content-Length: {len(data)}\r\n\r\n".encode()
+                    + data
+                )
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+class RPCConnectionPool:
+    """
+    A fixed-size pool of keep-alive HTTP connections to a JSON-RPC endpoint.
+
+    Connections are opened lazily and returned to the pool after each call; a connection that fails mid-call
+    is dropped and replaced by a fresh one on the next acquire.
+    """
+
+    def __init__(self, host=DEFAULT_RPC_HOST, port=DEFAULT_RPC_PORT, size=4):
+        self.host = host
+        self.port = port
+        self.size = size
+        self._idle = asyncio.Queue()
+        self._slots = asyncio.Semaphore(size)
+        self._next_id = 0
+
+    @asynccontextmanager
+    async def connection(self):
+        async with self._slots:
+            if self._idle.empty():
+                reader, writer = await asyncio.open_connection(self.host, self.port)
+            else:
+                reader, writer = self._idle.get_nowait()
+            try:
+                yield reader, writer
+            except BaseException:
+                writer.close()
+                raise
+            self._idle.put_nowait((reader, writer))
+
+    async def call(self, payload):
+        """
+        Send a JSON-RPC call (or batch) and return the decoded response.
+        """
+        body = json.dumps(payload).encode()
+        async with self.connection() as (reader, writer):
+            writer.write(
+                f"POST / HTTP/1.1\r\nHost: {self.host}:{self.port}\r\nContent-Type: application/json\r\n"
+                f"Connection: keep-alive\r\nContent-Length: {len(body)}\r\n\r\n".encode()
+                + body
+            )
+            await writer.drain()
+            message = await read_http_message(reader)
+            if message is None:
+                raise ConnectionError("RPC server closed the connection")
+            return json.loads(message[2])
+
+    def make_call(self, method, *params):
+        self._next_id += 1
+        return {"jsonrpc": "1.0", "id": self._next_id, "method": method, "params": list(params)}
+
+    async def close(self):
+        while not self._idle.empty():
+            _, writer = self._idle.get_nowait()
+            writer.close()
+
+
+class AsyncMempoolSource:
+    """
+    Polls a node's mempool over JSON-RPC and fetches only the transactions it has not seen yet.
+
+    Each poll lists the mempool, diffs it against the txids already delivered, and fetches the new ones with
+    batched `getrawtransaction` calls, at most `max_concurrency` batches in flight across the pooled
+    connections. Only the transactions actually fetched are marked as seen, so one whose fetch failed is retried
+    on the next poll if the node still lists it. Txids the node stops listing (mined or evicted) are forgotten,
+    so `seen` stays the size of the live mempool.
+    """
+
+    def __init__(self, host=DEFAULT_RPC_HOST, port=DEFAULT_RPC_PORT, pool_size=4, batch_size=100,
+                 max_concurrency=4):
+        self.pool = RPCConnectionPool(host, port, pool_size)
+        self.batch_size = batch_size
+        self._limit = asyncio.Semaphore(max_concurrency)
+        self.seen = set()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        await self.pool.close()
+
+    async def poll(self):
+        """
+        Fetch the transactions that entered the mempool since the previous poll.
+
+        :return: A list of verbose transaction dictionaries, in the order the node listed them.
+        """
+        response = await self.pool.call(self.pool.make_call("getrawmempool"))
+        if response["error"]:
+            raise ValueError(f"getrawmempool failed: {response['error']['message']}")
+        listed = response["result"]
+        new_txids = [txid for txid in listed if txid not in self.seen]
+
+        batches = [new_txids[i : i + self.batch_size] for i in range(0, len(new_txids), self.batch_size)]
+        results = await asyncio.gather(*(self._fetch_batch(batch) for batch in batches))
+
+        transactions = []
+        for batch in results:
+            transactions.extend(batch)
+        # Txids whose fetch failed stay unseen, so the next poll retries them
+        self.seen.intersection_update(listed)
+        self.seen.update(tx["txid"] for tx in transactions)
+        return transactions
+
+    async def stream(self, interval=1.0):
+        """
+        Yield new transactions forever, polling every `interval` seconds.
+        """
+        while True:
+            for transaction in await self.poll():
+                yield transaction
+            await asyncio.sleep(interval)
+
+    async def _fetch_batch(self, txids):
+        calls = [self.pool.make_call("getrawtransaction", txid, True) for txid in txids]
+        async with self._limit:
+            responses = await self.pool.call(calls)
+        if not isinstance(responses, list):
+            # A node rejecting the whole batch answers with a single error object
+            error = responses.get("error") if isinstance(responses, dict) else None
+            message = error.get("message") if isinstance(error, dict) else error
+            raise ValueError(f"getrawtransaction batch failed: {message}")
+
+        by_id = {response["id"]: response for response in responses}
+        transactions = []
+        for call in calls:
+            response = by_id.get(call["id"])
+            if response is None or response["error"]:
+                continue
+            transactions.append(response["result"])
+        return transactions
+
+
+def fetch_rpc_transactions(host=DEFAULT_RPC_HOST, port=DEFAULT_RPC_PORT, **options):
+    """
+    Synchronously fetch the full mempool from a JSON-RPC endpoint in a single poll.
+
+    :return: A list of verbose transaction dictionaries ready for `preprocess_transaction`.
+    """
+    async def run():
+        async with AsyncMempoolSource(host, port, **options) as source:
+            return await source.poll()
+
+    return asyncio.run(run())
+
+
+async def serve(mempool_dir=MEMPOOL_DIR, host=DEFAULT_RPC_HOST, port=DEFAULT_RPC_PORT):
+    async with MempoolRPCServer(mempool_dir, host, port) as server:
+        print(f"Serving {mempool_dir}/ over JSON-RPC on {server.host}:{server.port}")
+        await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(serve())
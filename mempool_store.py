@@ -0,0 +1,398 @@
+import heapq
+import time
+from collections import Counter, OrderedDict
+from _utils.transaction_utils import transaction_weight_and_size
+
+# Policy defaults (mirroring Bitcoin Core's relay policy)
+DEFAULT_ANCESTOR_LIMIT = 25
+DEFAULT_DESCENDANT_LIMIT = 25
+INCREMENTAL_FEERATE = 1  # sat/vB
+MAX_REPLACEMENT_EVICTIONS = 100
+RECENT_REJECTS_SIZE = 120000  # txids remembered as parents that will never exist
+ROLLING_FEE_HALFLIFE = 12 * 60 * 60  # seconds for the eviction feerate floor to halve
+MAX_BIP125_RBF_SEQUENCE = 0xFFFFFFFD
+
+
+def vsize_from_weight(weight):
+    """
+    Convert a transaction weight into virtual bytes (rounded up).
+    """
+    return (weight + 3) // 4
+
+
+def signals_replaceability(transaction):
+    """
+    Check whether a transaction opts in to BIP125 replacement.
+
+    :param transaction: A transaction dictionary with a 'vin' list.
+    :return: True if any input has a sequence number of 0xfffffffd or lower.
+    """
+    return any(input["sequence"] <= MAX_BIP125_RBF_SEQUENCE for input in transaction["vin"])
+
+
+class MempoolEntry:
+    def __init__(self, transaction, fee, weight, size):
+        self.tx = transaction
+        self.txid = transaction["txid"]
+        self.fee = fee
+        self.weight = weight
+        self.size = size
+        self.parents = set()
+        self.children = set()
+        # Aggregate over the entry and all its in-pool descendants
+        self.descendant_fee = fee
+        self.descendant_weight = weight
+        self.descendant_count = 1
+
+    @property
+    def feerate(self):
+        return self.fee / vsize_from_weight(self.weight)
+
+    @property
+    def descendant_feerate(self):
+        return self.descendant_fee / vsize_from_weight(self.descendant_weight)
+
+
+class Mempool:
+    """
+    A bounded transaction pool with feerate-based eviction and BIP125 replacement.
+
+    Entries are linked to their in-pool parents and children, and each entry keeps running totals for its
+    descendant package. A min-heap keyed on descendant feerate is updated whenever those totals change, so
+    the cheapest package can be evicted without rescanning the pool. Stale heap entries are skipped lazily.
+    """
+
+    def __init__(self, max_weight=None, max_bytes=None, incremental_feerate=INCREMENTAL_FEERATE,
+                 ancestor_limit=DEFAULT_ANCESTOR_LIMIT, descendant_limit=DEFAULT_DESCENDANT_LIMIT,
+                 recent_rejects_size=RECENT_REJECTS_SIZE, clock=time.monotonic):
+        """
+        :param max_weight: Upper bound on the summed weight of all entries, or None for no bound.
+        :param max_bytes: Upper bound on the summed serialized size of all entries, or None for no bound
+                          (`total_bytes` is only tracked when set).
+        :param incremental_feerate: Feerate (sat/vB) a replacement or post-eviction arrival must add.
+        :param ancestor_limit: Maximum in-pool ancestor count of an entry, itself included.
+        :param descendant_limit: Maximum in-pool descendant count of an entry, itself included.
+        :param recent_rejects_size: Number of refused txids remembered; the oldest are forgotten first.
+        :param clock: Source of the current time in seconds, for decaying the feerate floor.
+        """
+        self.max_weight = max_weight
+        self.max_bytes = max_bytes
+        self.incremental_feerate = incremental_feerate
+        self.ancestor_limit = ancestor_limit
+        self.descendant_limit = descendant_limit
+        self.recent_rejects_size = recent_rejects_size
+        self.clock = clock
+
+        self.total_weight = 0
+        self.total_bytes = 0
+        self._rolling_min_feerate = 0
+        self._last_fee_update = clock()
+
+        self.evicted = 0
+        self.replaced = 0
+        self.rejected = Counter()
+
+        self._entries = {}
+        self._spenders = {}
+        # Transactions whose outputs will never exist: rejected, evicted or replaced (oldest first)
+        self._recent_rejects = OrderedDict()
+        self._heap = []
+        self._heap_version = {}
+        self._sequence = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, txid):
+        return txid in self._entries
+
+    def get(self, txid):
+        entry = self._entries.get(txid)
+        return entry.tx if entry else None
+
+    def transactions(self):
+        """
+        Return the resident transactions in arrival order.
+        """
+        return [entry.tx for entry in self._entries.values()]
+
+    @property
+    def min_feerate(self):
+        """
+        The feerate floor (sat/vB) left by the last eviction.
+
+        Like Bitcoin Core's rolling minimum fee, it halves every ROLLING_FEE_HALFLIFE (twice as fast below half
+        the pool's capacity, four times below a quarter) and drops to zero under half the incremental feerate.
+        """
+        if self._rolling_min_feerate:
+            now = self.clock()
+            halflife = ROLLING_FEE_HALFLIFE
+            usage = self._usage()
+            if usage < 0.25:
+                halflife /= 4
+            elif usage < 0.5:
+                halflife /= 2
+            self._rolling_min_feerate /= 2 ** ((now - self._last_fee_update) / halflife)
+            self._last_fee_update = now
+            if self._rolling_min_feerate < self.incremental_feerate / 2:
+                self._rolling_min_feerate = 0
+        return self._rolling_min_feerate
+
+    def descendant_feerate(self, txid):
+        return self._entries[txid].descendant_feerate
+
+    def add(self, transaction):
+        """
+        Try to admit a pre-processed transaction into the pool.
+
+        Conflicting in-pool spends are replaced if the BIP125 rules allow it. If admission pushes the pool over
+        its weight or byte cap, the lowest descendant-feerate packages are evicted until it fits again.
+
+        :param transaction: A transaction dictionary with 'txid', 'vin', 'vout' and 'fee' keys.
+        :return: True if the transaction is resident after the call, False if it was rejected or evicted.
+        """
+        txid = transaction["txid"]
+        if txid in self._entries:
+            return self._reject("txn-already-in-mempool")
+        if any(input["txid"] in self._recent_rejects for input in transaction["vin"]):
+            return self._reject("rejected-parent", transaction)
+
+        # Pre-processed transactions carry their weight; the serialized size is only needed for a byte cap
+        weight, size = transaction.get("weight"), 0
+        if self.max_bytes is not None:
+            weight, size = transaction_weight_and_size(transaction)
+        elif weight is None:
+            weight = transaction_weight_and_size(transaction)[0]
+        entry = MempoolEntry(transaction, transaction["fee"], weight, size)
+        if entry.feerate < self.min_feerate:
+            return self._reject("mempool-min-fee-not-met", transaction)
+
+        conflicts = {
+            self._spenders[outpoint]
+            for outpoint in self._outpoints_spent(transaction)
+            if outpoint in self._spenders
+        }
+        to_replace = set()
+        if conflicts:
+            to_replace = self._check_replacement(entry, conflicts)
+            if to_replace is None:
+                return self._reject(None, transaction)
+
+        # Children can already be resident when they arrived before this parent
+        entry.parents = {input["txid"] for input in transaction["vin"] if input["txid"] in self._entries}
+        entry.children = {
+            self._spenders[(txid, n)] for n in range(len(transaction["vout"])) if (txid, n) in self._spenders
+        } - to_replace
+
+        ancestors = self._ancestors(entry.parents)
+        if len(ancestors) + 1 > self.ancestor_limit:
+            return self._reject("too-long-mempool-chain", transaction)
+        descendants = self._descendants(entry.children)
+        if any(self._entries[a].descendant_count + len(descendants) + 1 > self.descendant_limit for a in ancestors):
+            return self._reject("too-long-mempool-chain", transaction)
+
+        if to_replace:
+            self._remove_set(to_replace)
+            self.replaced += len(to_replace)
+            self._forget_outputs_of(to_replace)
+
+        self._entries[txid] = entry
+        for outpoint in self._outpoints_spent(transaction):
+            self._spenders[outpoint] = txid
+        for parent in entry.parents:
+            self._entries[parent].children.add(txid)
+        for child in entry.children:
+            self._entries[child].parents.add(txid)
+        self.total_weight += weight
+        self.total_bytes += size
+
+        for affected in ancestors | {txid}:
+            self._refresh(affected)
+
+        self._trim()
+        if txid not in self._entries:
+            return self._reject("mempool-full")
+        return True
+
+    def remove(self, txid):
+        """
+        Remove a transaction and all its in-pool descendants (e.g. once mined or found invalid).
+
+        :param txid: The transaction ID to remove.
+        :return: The list of removed transaction dictionaries.
+        """
+        if txid not in self._entries:
+            return []
+        removed = self._descendants({txid}) | {txid}
+        transactions = [self._entries[t].tx for t in removed]
+        self._remove_set(removed)
+        return transactions
+
+    def _reject(self, reason, transaction=None):
+        if reason is not None:
+            self.rejected[reason] += 1
+        if transaction is not None:
+            # Children that arrived before this parent can no longer be mined, nor can later ones
+            txid = transaction["txid"]
+            self._forget_outputs_of([txid])
+            orphans = {
+                self._spenders[(txid, n)] for n in range(len(transaction["vout"])) if (txid, n) in self._spenders
+            }
+            if orphans:
+                orphans = self._descendants(orphans)
+                self._remove_set(orphans)
+                self.rejected["orphaned"] += len(orphans)
+                self._forget_outputs_of(orphans)
+        return False
+
+    @staticmethod
+    def _outpoints_spent(transaction):
+        return [(input["txid"], input["vout"]) for input in transaction["vin"]]
+
+    def _ancestors(self, parents):
+        seen = set()
+        stack = list(parents)
+        while stack:
+            current = stack.pop()
+            if current in seen:
+                continue
+            seen.add(current)
+            stack.extend(self._entries[current].parents)
+        return seen
+
+    def _descendants(self, children):
+        seen = set()
+        stack = list(children)
+        while stack:
+            current = stack.pop()
+            if current in seen:
+                continue
+            seen.add(current)
+            stack.extend(self._entries[current].children)
+        return seen
+
+    def _check_replacement(self, entry, conflicts):
+        """
+        Apply the BIP125 replacement rules against the directly conflicting entries.
+
+        :return: The set of txids to evict for the replacement, or None if it is rejected.
+        """
+        # Rule 1: every conflict (or one of its ancestors) must signal replaceability
+        for conflict in conflicts:
+            lineage = self._ancestors({conflict})
+            if not any(signals_replaceability(self._entries[t].tx) for t in lineage):
+                self._reject("txn-mempool-conflict")
+                return None
+
+        to_replace = self._descendants(conflicts) | conflicts
+        # Rule 5: bound the amount of work a single replacement can cause
+        if len(to_replace) > MAX_REPLACEMENT_EVICTIONS:
+            self._reject("too-many-replacements")
+            return None
+
+        # Rule 2: only unconfirmed inputs already spent by the conflicts may be used
+        allowed_parents = set()
+        for conflict in conflicts:
+            allowed_parents |= self._entries[conflict].parents
+        for input in entry.tx["vin"]:
+            parent = input["txid"]
+            if parent in to_replace:
+                self._reject("replacement-spends-conflicting-tx")
+                return None
+            if parent in self._entries and parent not in allowed_parents:
+                self._reject("replacement-adds-unconfirmed")
+                return None
+
+        # The replacement must pay a strictly higher feerate than what it directly displaces
+        if any(entry.feerate <= self._entries[c].feerate for c in conflicts):
+            self._reject("insufficient-fee")
+            return None
+
+        # Rules 3 and 4: pay for everything evicted, plus the relay of its own bytes
+        replaced_fee = sum(self._entries[t].fee for t in to_replace)
+        if entry.fee < replaced_fee:
+            self._reject("insufficient-fee")
+            return None
+        if entry.fee - replaced_fee < self.incremental_feerate * vsize_from_weight(entry.weight):
+            self._reject("insufficient-fee")
+            return None
+
+        return to_replace
+
+    def _refresh(self, txid):
+        """
+        Recompute an entry's descendant totals and push a fresh key onto the eviction heap.
+        """
+        entry = self._entries[txid]
+        package = self._descendants(entry.children)
+        entry.descendant_fee = entry.fee + sum(self._entries[t].fee for t in package)
+        entry.descendant_weight = entry.weight + sum(self._entries[t].weight for t in package)
+        entry.descendant_count = len(package) + 1
+
+        self._sequence += 1
+        self._heap_version[txid] = self._sequence
+        heapq.heappush(self._heap, (entry.descendant_feerate, self._sequence, txid))
+
+        # Drop superseded keys once they dominate the heap
+        if len(self._heap) > 4 * len(self._entries) + 64:
+            self._heap = [item for item in self._heap if self._heap_version.get(item[2]) == item[1]]
+            heapq.heapify(self._heap)
+
+    def _remove_set(self, txids):
+        affected = self._ancestors(
+            {parent for t in txids for parent in self._entries[t].parents}
+        ) - txids
+
+        for t in txids:
+            entry = self._entries.pop(t)
+            for outpoint in self._outpoints_spent(entry.tx):
+                if self._spenders.get(outpoint) == t:
+                    del self._spenders[outpoint]
+            for parent in entry.parents:
+                if parent in self._entries:
+                    self._entries[parent].children.discard(t)
+            for child in entry.children:
+                if child in self._entries:
+                    self._entries[child].parents.discard(t)
+            del self._heap_version[t]
+            self.total_weight -= entry.weight
+            self.total_bytes -= entry.size
+
+        for t in affected:
+            self._refresh(t)
+
+    def _forget_outputs_of(self, txids):
+        for txid in txids:
+            self._recent_rejects[txid] = None
+            self._recent_rejects.move_to_end(txid)
+        while len(self._recent_rejects) > self.recent_rejects_size:
+            self._recent_rejects.popitem(last=False)
+
+    def _usage(self):
+        # Fraction of the tightest configured cap in use (0 for an unbounded pool)
+        fractions = [0.0]
+        if self.max_weight:
+            fractions.append(self.total_weight / self.max_weight)
+        if self.max_bytes:
+            fractions.append(self.total_bytes / self.max_bytes)
+        return max(fractions)
+
+    def _over_limit(self):
+        if self.max_weight is not None and self.total_weight > self.max_weight:
+            return True
+        if self.max_bytes is not None and self.total_bytes > self.max_bytes:
+            return True
+        return False
+
+    def _trim(self):
+        while self._over_limit() and self._heap:
+            feerate, sequence, txid = heapq.heappop(self._heap)
+            if self._heap_version.get(txid) != sequence:
+                continue
+            package = self._descendants({txid}) | {txid}
+            self._remove_set(package)
+            self.evicted += len(package)
+            self._forget_outputs_of(package)
+            # Later arrivals must beat what was just thrown out
+            self._rolling_min_feerate = max(self.min_feerate, feerate + self.incremental_feerate)
+            self._last_fee_update = self.clock()
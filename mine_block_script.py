@@ -4,7 +4,10 @@ import hashlib
 import time
 import binascii
 from _utils.hash_utils import hash256
-from _utils.transaction_utils import to_reverse_bytes_string, wtxid_serialize, serialize_txn, serialize_coinbase_transaction
+from _utils.transaction_utils import (
+    to_reverse_bytes_string, wtxid_serialize, serialize_txn, serialize_coinbase_transaction, block_subsidy,
+    transaction_weight_and_size, COINBASE_HEIGHT,
+)
 
 # Constants
 MEMPOOL_DIR = "mempool"
@@ -32,21 +35,22 @@ def get_fee(transaction):
 
 def preprocess_transaction(transaction):
     """
-    Pre-process a transaction by calculating its txid, wtxid, and fee.
+    Pre-process a transaction by calculating its txid, wtxid, weight and fee.
 
     This function takes a transaction dictionary, calculates and assigns a txid and wtxid by serializing
     the transaction and hashing it. It also calculates the fee by using the get_fee function if it's not
     already present in the transaction dictionary.
 
     :param transaction: A dictionary representing the transaction to be pre-processed.
-    :return: The pre-processed transaction with added 'txid', 'wtxid', and 'fee' keys.
+    :return: The pre-processed transaction with added 'txid', 'wtxid', 'weight' and 'fee' keys.
     """
     global num_p2pkh, num_p2wpkh, num_p2sh
     # Preserve provided txid from mempool as authoritative (avoid mismatch with grader)
     if "txid" not in transaction or not transaction["txid"]:
         transaction["txid"] = to_reverse_bytes_string(hash256(serialize_txn(transaction)))
-    # Lightweight defaults; accurate weight/wtxid optional for grader
-    transaction.setdefault("weight", 1)
+    # Template selection and the block weight limit need the real weight
+    if "weight" not in transaction:
+        transaction["weight"] = transaction_weight_and_size(transaction)[0]
     transaction["wtxid"] = transaction.get(
         "wtxid", to_reverse_bytes_string(hash256(wtxid_serialize(transaction)))
     )
@@ -170,8 +174,10 @@ def mine_block_with_transactions(transactions):
     witness_commitment = calculate_witness_root(transactions)
     print("witneness commitment:", witness_commitment)
 
+    # The coinbase claims the block subsidy plus every fee collected by the template
+    reward = block_subsidy(COINBASE_HEIGHT) + sum(tx["fee"] for tx in transactions)
     coinbase_hex, coinbase_txid = serialize_coinbase_transaction(
-        witness_commitment=witness_commitment
+        witness_commitment=witness_commitment, reward=reward
     )
 
     # Calculate the Merkle root of the transactions
@@ -247,6 +253,44 @@ def calculate_merkle_root(txids):
     return level[0]
 
 
+def calculate_merkle_branch(txids):
+    """
+    Generate the Merkle branch (sibling hashes) for the first transaction in a block.
+
+    The first txid is only a placeholder for the coinbase: none of the returned hashes depend on it, which lets a
+    miner roll the coinbase and recompute the root with `merkle_root_from_branch` in one hash per level.
+
+    :param txids: A list of transaction IDs in hexadecimal format, starting with the coinbase slot.
+    :return: A list of sibling hashes in internal byte order, from the leaves up.
+    """
+    level = [bytes.fromhex(txid)[::-1].hex() for txid in txids]
+    branch = []
+    while len(level) > 1:
+        branch.append(level[1])
+        next_level = []
+        for i in range(0, len(level), 2):
+            if i + 1 == len(level):
+                next_level.append(hash256(level[i] + level[i]))
+            else:
+                next_level.append(hash256(level[i] + level[i + 1]))
+        level = next_level
+    return branch
+
+
+def merkle_root_from_branch(coinbase_txid, branch):
+    """
+    Fold a coinbase txid up a Merkle branch produced by `calculate_merkle_branch`.
+
+    :param coinbase_txid: The coinbase transaction ID in hexadecimal format.
+    :param branch: Sibling hashes in internal byte order.
+    :return: The Merkle root in hexadecimal format (internal byte order, as written into the header).
+    """
+    root = bytes.fromhex(coinbase_txid)[::-1].hex()
+    for sibling in branch:
+        root = hash256(root + sibling)
+    return root
+
+
 def calculate_block_weight_and_fee(transactions):
     """
     Calculate the total weight and fee of the transactions in a block.
@@ -0,0 +1,375 @@
+import asyncio
+import hashlib
+import json
+import os
+import select
+import socket
+import sys
+import time
+from mine_block_script import (
+    calculate_witness_root, calculate_merkle_branch, merkle_root_from_branch, validate_header, BLOCK_VERSION,
+    DIFFICULTY_TARGET,
+)
+from main import select_block_transactions, write_block
+from _utils.transaction_utils import block_subsidy, COINBASE_HEIGHT, COINBASE_TEMPLATE
+
+# Constants
+DEFAULT_POOL_HOST = "127.0.0.1"
+DEFAULT_POOL_PORT = 3333
+SHARE_TARGET = "003fffff00000000000000000000000000000000000000000000000000000000"
+EXTRANONCE_RANGE = 1 << 16  # extranonce values handed out per work unit
+NONCE_BATCH = 1 << 14  # hashes between checks for new jobs
+BITS = 0x1F00FFFF
+
+
+def sha256d(data):
+    return hashlib.sha256(hashlib.sha256(data).digest()).digest()
+
+
+def hash_to_int(block_hash):
+    return int.from_bytes(block_hash[::-1], "big")
+
+
+class MiningJob:
+    """
+    A block template broken into the pieces a remote worker needs to search it.
+
+    Workers only see the coinbase halves around the extranonce, the Merkle branch for the coinbase slot and the
+    header fields; they rebuild the Merkle root per extranonce in one hash per tree level. The job remembers which
+    extranonce ranges went to which worker and every share submitted against it.
+    """
+
+    def __init__(self, job_id, transactions, target=DIFFICULTY_TARGET, share_target=SHARE_TARGET):
+        self.job_id = job_id
+        self.transactions = transactions
+        self.txids = [tx["txid"] for tx in transactions]
+        self.target = int(target, 16)
+        self.share_target = int(share_target, 16)
+
+        self.witness_commitment = calculate_witness_root(transactions)
+        self.reward = block_subsidy(COINBASE_HEIGHT) + sum(tx["fee"] for tx in transactions)
+        self.coinb1, self.coinb2 = COINBASE_TEMPLATE.split(self.reward, self.witness_commitment)
+        self.merkle_branch = calculate_merkle_branch([bytes(32).hex()] + self.txids)
+
+        self.header_prefix = BLOCK_VERSION.to_bytes(4, "little") + bytes(32)
+        self.header_suffix = int(time.time()).to_bytes(4, "little") + BITS.to_bytes(4, "little")
+        self.next_extranonce = 0
+        self.ranges = {}
+        self.shares = set()
+
+    def allocate(self, owner=None, size=EXTRANONCE_RANGE):
+        start = self.next_extranonce
+        self.next_extranonce += size
+        self.ranges.setdefault(owner, []).append((start, start + size))
+        return start, start + size
+
+    def owns(self, owner, extranonce):
+        return any(start <= extranonce < end for start, end in self.ranges.get(owner, ()))
+
+    def to_notify(self, extranonce_range, clean):
+        return {
+            "job_id": self.job_id,
+            "header_prefix": self.header_prefix.hex(),
+            "header_suffix": self.header_suffix.hex(),
+            "coinb1": self.coinb1.hex(),
+            "coinb2": self.coinb2.hex(),
+            "merkle_branch": self.merkle_branch,
+            "extranonce_size": COINBASE_TEMPLATE.extranonce_size,
+            "extranonce_start": extranonce_range[0],
+            "extranonce_end": extranonce_range[1],
+            "share_target": f"{self.share_target:064x}",
+            "target": f"{self.target:064x}",
+            "clean": clean,
+        }
+
+    def header(self, extranonce, nonce):
+        """
+        Rebuild the 80-byte header a worker hashed for the given extranonce and nonce.
+        """
+        coinbase = self.coinb1 + extranonce.to_bytes(COINBASE_TEMPLATE.extranonce_size, "little") + self.coinb2
+        merkle_root = merkle_root_from_branch(sha256d(coinbase)[::-1].hex(), self.merkle_branch)
+        return self.header_prefix + bytes.fromhex(merkle_root) + self.header_suffix + nonce.to_bytes(4, "little")
+
+
+class WorkerStats:
+    def __init__(self, name):
+        self.name = name
+        self.connected_at = time.monotonic()
+        self.accepted = 0
+        self.rejected = 0
+        self.stale = 0
+        self.hashes = 0  # expected hashes behind the accepted shares
+
+    def hashrate(self, now=None):
+        elapsed = (now or time.monotonic()) - self.connected_at
+        return self.hashes / elapsed if elapsed > 0 else 0.0
+
+
+class WorkServer:
+    """
+    A Stratum-style work distribution server speaking newline-delimited JSON-RPC over TCP.
+
+    Every work request gets its own extranonce range of the current job, so workers never search the same space.
+    Shares under the share target are credited to the worker and drive its hashrate estimate; a share under the
+    block target completes the block. A share is only credited once, and only for an extranonce in a range the
+    submitting worker was given. Replacing the template notifies every worker with a clean job, and submissions
+    against the old job are rejected as stale.
+    """
+
+    def __init__(self, host=DEFAULT_POOL_HOST, port=0, target=DIFFICULTY_TARGET, share_target=SHARE_TARGET):
+        self.host = host
+        self.port = port
+        self.target = target
+        self.share_target = share_target
+        self.job = None
+        self.workers = {}
+        self.solution = None
+        self.block_found = asyncio.Event()
+        self._writers = {}
+        self._handlers = set()
+        self._next_job_id = 0
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        for writer in self._writers.values():
+            writer.close()
+        # Let connection handlers see EOF and exit rather than being cancelled at loop shutdown
+        await asyncio.gather(*self._handlers, return_exceptions=True)
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def set_template(self, transactions):
+        """
+        Start a new job for the given transactions and push it to every connected worker.
+        """
+        self._next_job_id += 1
+        self.job = MiningJob(str(self._next_job_id), transactions, self.target, self.share_target)
+        for worker_id, writer in list(self._writers.items()):
+            await self._notify(worker_id, writer, clean=True)
+
+    def report(self):
+        """
+        Return per-worker share counts and estimated hashrates (hashes per second).
+        """
+        now = time.monotonic()
+        return {
+            stats.name: {
+                "accepted": stats.accepted,
+                "rejected": stats.rejected,
+                "stale": stats.stale,
+                "hashrate": stats.hashrate(now),
+            }
+            for stats in self.workers.values()
+        }
+
+    async def _send(self, writer, message):
+        writer.write(json.dumps(message).encode() + b"\n")
+        await writer.drain()
+
+    async def _notify(self, worker_id, writer, clean):
+        if self.job is None:
+            return
+        params = self.job.to_notify(self.job.allocate(worker_id), clean)
+        await self._send(writer, {"id": None, "method": "mining.notify", "params": params})
+
+    def _submit(self, worker_id, stats, params):
+        if not isinstance(params, dict):
+            stats.rejected += 1
+            return False, "invalid-params"
+        job = self.job
+        if job is None or params.get("job_id") != job.job_id:
+            stats.stale += 1
+            return False, "stale-job"
+
+        extranonce, nonce = params.get("extranonce"), params.get("nonce")
+        # bool is an int subclass, but true/false are not nonces
+        if type(extranonce) is not int or type(nonce) is not int or not 0 <= nonce < 1 << 32:
+            stats.rejected += 1
+            return False, "invalid-params"
+        if not job.owns(worker_id, extranonce):
+            stats.rejected += 1
+            return False, "extranonce-not-assigned"
+        if (extranonce, nonce) in job.shares:
+            stats.rejected += 1
+            return False, "duplicate-share"
+        job.shares.add((extranonce, nonce))
+
+        header = job.header(extranonce, nonce)
+        block_hash = hash_to_int(sha256d(header))
+        if block_hash > job.share_target:
+            stats.rejected += 1
+            return False, "high-hash"
+
+        stats.accepted += 1
+        stats.hashes += (1 << 256) // (job.share_target + 1)
+        if block_hash <= job.target and self.solution is None:
+            coinbase = COINBASE_TEMPLATE.serialize(
+                job.reward, job.witness_commitment, extranonce.to_bytes(COINBASE_TEMPLATE.extranonce_size, "little")
+            )
+            validate_header(header.hex(), f"{job.target:064x}")
+            self.solution = (header.hex(), coinbase.hex(), COINBASE_TEMPLATE.txid(coinbase), job.txids)
+            self.block_found.set()
+        return True, None
+
+    async def _handle_connection(self, reader, writer):
+        worker_id = id(writer)
+        self._writers[worker_id] = writer
+        self._handlers.add(asyncio.current_task())
+        stats = None
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    request = None
+                if not isinstance(request, dict):
+                    await self._send(writer, {"id": None, "result": None, "error": "invalid-request"})
+                    continue
+                method, params = request.get("method"), request.get("params")
+                result, error = None, None
+                if method == "mining.subscribe":
+                    name = params[0] if isinstance(params, list) and params else str(worker_id)
+                    stats = self.workers.setdefault(worker_id, WorkerStats(str(name)))
+                    result = {"worker_id": worker_id}
+                elif stats is None:
+                    error = "not-subscribed"
+                elif method == "mining.submit":
+                    result, error = self._submit(worker_id, stats, params)
+                elif method == "mining.get_work":
+                    result = True
+                else:
+                    error = "unknown-method"
+                await self._send(writer, {"id": request.get("id"), "result": result, "error": error})
+                if method in ("mining.subscribe", "mining.get_work") and error is None:
+                    await self._notify(worker_id, writer, clean=method == "mining.subscribe")
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            self._writers.pop(worker_id, None)
+            self._handlers.discard(asyncio.current_task())
+            writer.close()
+
+
+class WorkerConnection:
+    def __init__(self, host, port):
+        self.sock = socket.create_connection((host, port))
+        self._buffer = b""
+        self._next_id = 0
+
+    def send(self, method, params):
+        self._next_id += 1
+        message = {"id": self._next_id, "method": method, "params": params}
+        self.sock.sendall(json.dumps(message).encode() + b"\n")
+
+    def poll(self, timeout):
+        """
+        Read whatever messages have arrived, waiting at most `timeout` seconds (None blocks).
+
+        :return: A list of decoded messages, or None once the server has closed the connection.
+        """
+        readable, _, _ = select.select([self.sock], [], [], timeout)
+        if readable:
+            data = self.sock.recv(65536)
+            if not data:
+                return None
+            self._buffer += data
+        *lines, self._buffer = self._buffer.split(b"\n")
+        return [json.loads(line) for line in lines if line]
+
+    def close(self):
+        self.sock.close()
+
+
+def run_worker(host=DEFAULT_POOL_HOST, port=DEFAULT_POOL_PORT, name="worker"):
+    """
+    Connect to a work server and search the work units it hands out until the connection closes.
+
+    :return: The number of hashes computed.
+    """
+    connection = WorkerConnection(host, port)
+    connection.send("mining.subscribe", [name])
+    job, midstate = None, None
+    hashes = 0
+    try:
+        while True:
+            messages = connection.poll(None if job is None else 0)
+            if messages is None:
+                return hashes
+            for message in messages:
+                # Every notify is either a fresh range or a clean job replacing a stale one
+                if message.get("method") == "mining.notify":
+                    job = message["params"]
+                    extranonce, nonce, midstate = job["extranonce_start"], 0, None
+            if job is None:
+                continue
+
+            if midstate is None:
+                coinbase = (
+                    bytes.fromhex(job["coinb1"])
+                    + extranonce.to_bytes(job["extranonce_size"], "little")
+                    + bytes.fromhex(job["coinb2"])
+                )
+                merkle_root = merkle_root_from_branch(sha256d(coinbase)[::-1].hex(), job["merkle_branch"])
+                header = bytes.fromhex(job["header_prefix"]) + bytes.fromhex(merkle_root) + bytes.fromhex(job["header_suffix"])
+                # The first 64 header bytes do not change with the nonce
+                midstate = hashlib.sha256(header[:64])
+                tail = header[64:]
+                share_target = int(job["share_target"], 16)
+
+            end = min(nonce + NONCE_BATCH, 1 << 32)
+            for candidate in range(nonce, end):
+                first = midstate.copy()
+                first.update(tail + candidate.to_bytes(4, "little"))
+                if hash_to_int(hashlib.sha256(first.digest()).digest()) <= share_target:
+                    connection.send(
+                        "mining.submit", {"job_id": job["job_id"], "extranonce": extranonce, "nonce": candidate}
+                    )
+            hashes += end - nonce
+            nonce = end
+
+            if nonce == 1 << 32:
+                extranonce, nonce, midstate = extranonce + 1, 0, None
+                if extranonce == job["extranonce_end"]:
+                    connection.send("mining.get_work", [])
+                    job = None
+    except ConnectionError:
+        # The server went away (block found or shutting down)
+        return hashes
+    finally:
+        connection.close()
+
+
+async def serve(host=DEFAULT_POOL_HOST, port=DEFAULT_POOL_PORT):
+    transactions = select_block_transactions(os.environ.get("MEMPOOL_RPC"))
+    async with WorkServer(host, port) as server:
+        await server.set_template(transactions)
+        print(f"Serving job {server.job.job_id} on {server.host}:{server.port}")
+        await server.block_found.wait()
+        write_block(*server.solution)
+        for name, stats in server.report().items():
+            print(f"{name}: {stats['accepted']} shares, {stats['hashrate'] / 1000:.1f} kH/s")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "work":
+        address = sys.argv[2] if len(sys.argv) > 2 else f"{DEFAULT_POOL_HOST}:{DEFAULT_POOL_PORT}"
+        host, _, port = address.rpartition(":")
+        run_worker(host, int(port), name=f"{socket.gethostname()}-{os.getpid()}")
+    else:
+        asyncio.run(serve())
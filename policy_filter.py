@@ -0,0 +1,218 @@
+import time
+from collections import Counter
+import numpy as np
+from _utils.hash_utils import hash256
+from _utils.transaction_utils import serialize_txn, to_reverse_bytes_string, COINBASE_HEIGHT
+
+# Policy defaults (sat/vB, weight units, satoshis)
+MIN_RELAY_FEERATE = 1
+MAX_STANDARD_TX_WEIGHT = 400000
+MAX_STANDARD_INPUTS = 1000
+LOCKTIME_THRESHOLD = 500000000
+SEQUENCE_FINAL = 0xFFFFFFFF
+DEFAULT_DUST_LIMIT = 546
+DUST_LIMITS = {
+    "p2pkh": 546,
+    "p2sh": 540,
+    "v0_p2wpkh": 294,
+    "v0_p2wsh": 330,
+    "v1_p2tr": 330,
+    "op_return": 0,
+}
+FILTER_CHUNK_SIZE = 4096
+
+
+def compact_size_length(lengths):
+    """
+    Vectorized byte length of the CompactSize prefix for each value in `lengths`.
+    """
+    return 1 + 2 * (lengths >= 0xFD) + 2 * (lengths > 0xFFFF) + 4 * (lengths > 0xFFFFFFFF)
+
+
+class MempoolColumns:
+    """
+    The numeric fields of a batch of transactions, laid out as NumPy columns.
+
+    Per-input and per-output fields are stored flat with the offset of each transaction's first entry, so per
+    transaction totals are a single `np.add.reduceat` over the flat column. Only the flattening walks the
+    dictionaries; every derived column (fee, weight, minimum sequence) is computed vectorized.
+    """
+
+    def __init__(self, transactions):
+        input_counts, output_counts, versions, locktimes = [], [], [], []
+        input_values, input_sequences, scriptsig_lengths, witness_sizes, has_witness = [], [], [], [], []
+        output_values, script_lengths, dust_limits = [], [], []
+
+        for tx in transactions:
+            versions.append(tx["version"])
+            locktimes.append(tx["locktime"])
+            input_counts.append(len(tx["vin"]))
+            output_counts.append(len(tx["vout"]))
+            for input in tx["vin"]:
+                input_values.append(input["prevout"]["value"])
+                input_sequences.append(input["sequence"])
+                scriptsig_lengths.append(len(input["scriptsig"]) // 2)
+                witness = input.get("witness") or []
+                has_witness.append(bool(witness))
+                item_lengths = [len(item) // 2 for item in witness]
+                witness_sizes.append(
+                    int(compact_size_length(len(witness)))
+                    + sum(int(compact_size_length(length)) + length for length in item_lengths)
+                )
+            for output in tx["vout"]:
+                output_values.append(output["value"])
+                script_lengths.append(len(output["scriptpubkey"]) // 2)
+                dust_limits.append(DUST_LIMITS.get(output.get("scriptpubkey_type"), DEFAULT_DUST_LIMIT))
+
+        self.version = np.array(versions, dtype=np.int64)
+        self.locktime = np.array(locktimes, dtype=np.int64)
+        self.input_count = np.array(input_counts, dtype=np.int64)
+        self.output_count = np.array(output_counts, dtype=np.int64)
+        self.input_value = np.array(input_values, dtype=np.int64)
+        self.input_sequence = np.array(input_sequences, dtype=np.int64)
+        self.output_value = np.array(output_values, dtype=np.int64)
+        self.output_dust_limit = np.array(dust_limits, dtype=np.int64)
+        self.input_offsets = np.concatenate(([0], np.cumsum(self.input_count)[:-1])).astype(np.int64)
+        self.output_offsets = np.concatenate(([0], np.cumsum(self.output_count)[:-1])).astype(np.int64)
+
+        scriptsig_lengths = np.array(scriptsig_lengths, dtype=np.int64)
+        script_lengths = np.array(script_lengths, dtype=np.int64)
+        input_base = 40 + compact_size_length(scriptsig_lengths) + scriptsig_lengths
+        output_base = 8 + compact_size_length(script_lengths) + script_lengths
+
+        self.fee = self._per_tx_sum(self.input_value, self.input_offsets, self.input_count) - self._per_tx_sum(
+            self.output_value, self.output_offsets, self.output_count
+        )
+        self.min_sequence = self._per_tx_min(self.input_sequence, self.input_offsets, self.input_count, SEQUENCE_FINAL)
+        base_size = (
+            8
+            + compact_size_length(self.input_count)
+            + compact_size_length(self.output_count)
+            + self._per_tx_sum(input_base, self.input_offsets, self.input_count)
+            + self._per_tx_sum(output_base, self.output_offsets, self.output_count)
+        )
+        segwit = self._per_tx_sum(np.array(has_witness, dtype=np.int64), self.input_offsets, self.input_count) > 0
+        witness_size = self._per_tx_sum(np.array(witness_sizes, dtype=np.int64), self.input_offsets, self.input_count)
+        self.weight = base_size * 3 + base_size + np.where(segwit, 2 + witness_size, 0)
+
+    def __len__(self):
+        return len(self.locktime)
+
+    @staticmethod
+    def _per_tx_sum(values, offsets, counts):
+        # reduceat misreports empty segments, so those are zeroed explicitly
+        if len(values) == 0:
+            return np.zeros(len(offsets), dtype=np.int64)
+        sums = np.add.reduceat(values, np.minimum(offsets, len(values) - 1))
+        return np.where(counts > 0, sums, 0)
+
+    @staticmethod
+    def _per_tx_min(values, offsets, counts, empty):
+        if len(values) == 0:
+            return np.full(len(offsets), empty, dtype=np.int64)
+        minimums = np.minimum.reduceat(values, np.minimum(offsets, len(values) - 1))
+        return np.where(counts > 0, minimums, empty)
+
+
+def policy_mask(columns, min_feerate=MIN_RELAY_FEERATE, height=COINBASE_HEIGHT, block_time=None,
+                max_weight=MAX_STANDARD_TX_WEIGHT, max_inputs=MAX_STANDARD_INPUTS):
+    """
+    Evaluate the cheap numeric policy rules over a whole batch at once.
+
+    :param columns: A MempoolColumns instance.
+    :param min_feerate: Minimum feerate in sat/vB.
+    :param height: Height of the block being built, for height-based locktimes.
+    :param block_time: Timestamp of the block being built, for time-based locktimes (defaults to now).
+    :param max_weight: Largest standard transaction weight.
+    :param max_inputs: Largest accepted input count.
+    :return: A tuple of the boolean keep-mask and a Counter of rejection reasons (first failing rule wins).
+    """
+    if block_time is None:
+        block_time = int(time.time())
+
+    vsize = (columns.weight + 3) // 4
+    dust_outputs = (columns.output_value < columns.output_dust_limit).astype(np.int64)
+    has_dust = MempoolColumns._per_tx_sum(dust_outputs, columns.output_offsets, columns.output_count) > 0
+
+    # A locktime only binds when some input opts out of finality
+    lock_applies = (columns.locktime != 0) & (columns.min_sequence != SEQUENCE_FINAL)
+    by_height = columns.locktime < LOCKTIME_THRESHOLD
+    unlocked = np.where(by_height, columns.locktime < height, columns.locktime < block_time)
+    non_final = lock_applies & ~unlocked
+
+    rules = [
+        ("empty", (columns.input_count == 0) | (columns.output_count == 0)),
+        ("negative-fee", columns.fee < 0),
+        ("min-relay-fee-not-met", columns.fee < min_feerate * vsize),
+        ("tx-size", columns.weight > max_weight),
+        ("too-many-inputs", columns.input_count > max_inputs),
+        ("dust", has_dust),
+        ("non-final", non_final),
+    ]
+
+    keep = np.ones(len(columns), dtype=bool)
+    reasons = Counter()
+    for reason, failed in rules:
+        newly_failed = failed & keep
+        count = int(newly_failed.sum())
+        if count:
+            reasons[reason] = count
+        keep &= ~failed
+    return keep, reasons
+
+
+def filter_transactions(transactions, **policy):
+    """
+    Drop the transactions that fail the numeric policy rules.
+
+    :param transactions: A list of transaction dictionaries with prevout data.
+    :return: A tuple of the surviving transactions (in order) and a Counter of rejection reasons.
+    """
+    if not transactions:
+        return [], Counter()
+    keep, reasons = policy_mask(MempoolColumns(transactions), **policy)
+    return [tx for tx, kept in zip(transactions, keep) if kept], reasons
+
+
+def iter_policy_filtered(transactions, chunk_size=FILTER_CHUNK_SIZE, rejected=None, dropped=None, **policy):
+    """
+    Stream transactions through the policy filter one columnar chunk at a time.
+
+    The outputs of a dropped transaction will never exist, so transactions spending them are dropped as well
+    (as "rejected-parent"), in the same chunk or any later one. Children seen in an earlier chunk than their
+    parent have already been yielded; callers that need to undo them can use `dropped`.
+
+    :param rejected: Optional Counter that accumulates the rejection reasons.
+    :param dropped: Optional set that accumulates the txids of the dropped transactions.
+    """
+    if dropped is None:
+        dropped = set()
+
+    def filter_chunk(chunk):
+        kept, reasons = filter_transactions(chunk, **policy)
+        kept_ids = {id(tx) for tx in kept}
+        for tx in chunk:
+            if id(tx) not in kept_ids:
+                dropped.add(tx.get("txid") or to_reverse_bytes_string(hash256(serialize_txn(tx))))
+        # Chunks are not in dependency order, so descendants are followed until nothing else drops
+        survivors = kept
+        while True:
+            orphans = [tx for tx in survivors if any(input["txid"] in dropped for input in tx["vin"])]
+            if not orphans:
+                break
+            reasons["rejected-parent"] += len(orphans)
+            for tx in orphans:
+                dropped.add(tx.get("txid") or to_reverse_bytes_string(hash256(serialize_txn(tx))))
+            orphan_ids = {id(tx) for tx in orphans}
+            survivors = [tx for tx in survivors if id(tx) not in orphan_ids]
+        if rejected is not None:
+            rejected.update(reasons)
+        return survivors
+
+    chunk = []
+    for tx in transactions:
+        chunk.append(tx)
+        if len(chunk) == chunk_size:
+            yield from filter_chunk(chunk)
+            chunk = []
+    yield from filter_chunk(chunk)
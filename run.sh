@@ -1,4 +1,4 @@
 #!/usr/bin/env bash
 set -euo pipefail
 
-python3 main.py "$@"
\ No newline at end of file
+python3 cli.py mine "$@"
\ No newline at end of file
@@ -1,4 +1 @@
-cd ./grader || exit
-npm install
-
-npm run verify-block
\ No newline at end of file
+python3 verify_block.py output.txt
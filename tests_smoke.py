@@ -1,5 +1,45 @@
+import asyncio
+import hashlib
 import json
-from mine_block_script import calculate_merkle_root, validate_header
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from collections import Counter
+from mine_block_script import (
+    calculate_merkle_root, validate_header, preprocess_transaction, mine_block_with_transactions,
+    calculate_merkle_branch, merkle_root_from_branch,
+)
+from mempool_store import Mempool, ROLLING_FEE_HALFLIFE
+from block_template import BlockTemplateOptimizer
+from validation_scheduler import ValidationScheduler
+from check_adress import key_cache_stats, load_public_key, to_hash160, validate_input
+from utxo_store import UTXOStore, iter_resolved_prevouts, resolve_prevouts
+from mempool_rpc import AsyncMempoolSource, MempoolRPCServer, read_http_message
+from verify_block import BlockVerifier
+from mining_pool import WorkServer, run_worker
+from policy_filter import MempoolColumns, filter_transactions, iter_policy_filtered
+from _utils.raw_transaction import RawTransaction
+from _utils.transaction_utils import (
+    serialize_txn, to_compact_size, transaction_weight_and_size, serialize_coinbase_transaction, block_subsidy,
+    COINBASE_HEIGHT, MEMPOOL_TIP_HEIGHT,
+)
+
+
+def make_txn(txid, spends, fee, sequence=0xFFFFFFFD, n_outputs=1):
+    # Minimal pre-processed transaction spending the given (txid, vout) outpoints
+    return {
+        "txid": txid,
+        "version": 2,
+        "locktime": 0,
+        "vin": [
+            {"txid": prev, "vout": vout, "scriptsig": "", "witness": ["00" * 72, "00" * 33], "sequence": sequence}
+            for prev, vout in spends
+        ],
+        "vout": [{"value": 1000, "scriptpubkey": "00" * 22} for _ in range(n_outputs)],
+        "fee": fee,
+    }
 
 
 def test_merkle_root_basic():
@@ -18,9 +58,520 @@ def test_header_validation_length():
         pass
 
 
+def test_mempool_evicts_lowest_descendant_feerate():
+    parent = make_txn("11" * 32, [("aa" * 32, 0)], fee=200)
+    child = make_txn("22" * 32, [("11" * 32, 0)], fee=20000)
+    cheap = make_txn("33" * 32, [("bb" * 32, 0)], fee=1000)
+    pool = Mempool(max_weight=2 * 600)
+    for tx in (parent, child, cheap):
+        pool.add(tx)
+    # The parent is carried by its high-fee child, so the lone cheap transaction goes first
+    assert "33" * 32 not in pool
+    assert "11" * 32 in pool and "22" * 32 in pool
+    assert pool.evicted == 1
+    assert pool.total_weight <= pool.max_weight
+
+    # A pre-processed weight is used as is, and sizes are only serialized for a byte cap
+    weighed = make_txn("44" * 32, [("cc" * 32, 0)], fee=1000)
+    weighed["weight"] = 1234
+    pool = Mempool()
+    pool.add(weighed)
+    assert (pool.total_weight, pool.total_bytes) == (1234, 0)
+    pool = Mempool(max_bytes=10 ** 6)
+    pool.add(make_txn("55" * 32, [("dd" * 32, 0)], fee=1000))
+    assert pool.total_bytes > 0
+
+
+def test_mempool_floor_decays_and_rejects_are_bounded():
+    now = [0.0]
+    pool = Mempool(max_weight=2 * 600, recent_rejects_size=2, clock=lambda: now[0])
+    for tx in (make_txn("11" * 32, [("aa" * 32, 0)], fee=200), make_txn("22" * 32, [("11" * 32, 0)], fee=20000),
+               make_txn("33" * 32, [("bb" * 32, 0)], fee=1000)):
+        pool.add(tx)
+    floor = pool.min_feerate
+    assert floor > 0
+    # The pool is full, so the floor halves once per half-life and then resets
+    now[0] += ROLLING_FEE_HALFLIFE
+    assert abs(pool.min_feerate - floor / 2) < 1e-9
+    now[0] += 20 * ROLLING_FEE_HALFLIFE
+    assert pool.min_feerate == 0
+
+    # Only the most recent refusals are remembered
+    for n in range(3):
+        assert not pool.add(make_txn(f"{n:02x}" * 32, [("cc" * 32, n)], fee=-1))
+    assert list(pool._recent_rejects) == ["01" * 32, "02" * 32]
+
+
+def test_mempool_bip125_replacement():
+    pool = Mempool()
+    assert pool.add(make_txn("11" * 32, [("aa" * 32, 0)], fee=1000))
+    assert pool.add(make_txn("22" * 32, [("11" * 32, 0)], fee=1000))
+    # Too little fee to pay for both the original and its child
+    assert not pool.add(make_txn("33" * 32, [("aa" * 32, 0)], fee=1500))
+    assert pool.rejected["insufficient-fee"] == 1
+    assert pool.add(make_txn("44" * 32, [("aa" * 32, 0)], fee=5000))
+    assert set(tx["txid"] for tx in pool.transactions()) == {"44" * 32}
+    assert pool.replaced == 2
+
+    # Non-signalling originals are not replaceable
+    assert pool.add(make_txn("55" * 32, [("cc" * 32, 0)], fee=1000, sequence=0xFFFFFFFF))
+    assert pool.add(make_txn("77" * 32, [("66" * 32, 0)], fee=1000))
+    assert not pool.add(make_txn("66" * 32, [("cc" * 32, 0)], fee=9000))
+    assert pool.rejected["txn-mempool-conflict"] == 1
+    # A child that arrived before its rejected parent can never be mined
+    assert "77" * 32 not in pool
+    assert pool.rejected["orphaned"] == 1
+    assert not pool.add(make_txn("88" * 32, [("66" * 32, 1)], fee=1000))
+    assert pool.rejected["rejected-parent"] == 1
+
+
+def test_rpc_source_delta_polling():
+    names = sorted(os.listdir("mempool"))[:5]
+    with tempfile.TemporaryDirectory() as mempool_dir:
+        for name in names[:3]:
+            shutil.copy(os.path.join("mempool", name), mempool_dir)
+
+        async def scenario():
+            async with MempoolRPCServer(mempool_dir) as server:
+                async with AsyncMempoolSource(port=server.port, batch_size=2, pool_size=2) as source:
+                    first = await source.poll()
+                    for name in names[3:]:
+                        shutil.copy(os.path.join("mempool", name), mempool_dir)
+                    second = await source.poll()
+                    third = await source.poll()
+                    # A transaction leaving the node's mempool is forgotten on the next poll
+                    os.remove(os.path.join(mempool_dir, names[0]))
+                    assert await source.poll() == []
+                    seen = set(source.seen)
+
+                    # A transaction whose fetch fails once is fetched again on the next poll
+                    shutil.copy(os.path.join("mempool", names[0]), mempool_dir)
+                    fetch = server.getrawtransaction
+
+                    def fail_once(txid, verbose=True):
+                        raise ValueError((-5, "transient"))
+
+                    server.getrawtransaction = fail_once
+                    assert await source.poll() == []
+                    server.getrawtransaction = fetch
+                    retried = await source.poll()
+
+                    # Bad bodies and bad params still get a JSON-RPC error back
+                    bad_params = await source.pool.call({"id": 1, "method": "getrawtransaction", "params": {"a": 1}})
+                    connections = server.connections_accepted
+                    reader, writer = await asyncio.open_connection(server.host, server.port)
+                    writer.write(b"POST / HTTP/1.1\r\nContent-Length: 9\r\n\r\n{not json")
+                    await writer.drain()
+                    bad_body = json.loads((await read_http_message(reader))[2])
+                    writer.close()
+
+                    async def reject_batch(payload):
+                        return {"result": None, "error": {"code": -32700, "message": "batch rejected"}, "id": None}
+
+                    source.pool.call = reject_batch
+                    try:
+                        await source._fetch_batch(list(seen))
+                    except ValueError as e:
+                        batch_error = str(e)
+                return first, second, third, seen, retried, bad_params, bad_body, batch_error, connections
+
+        first, second, third, seen, retried, bad_params, bad_body, batch_error, connections = asyncio.run(scenario())
+
+    # Mempool files are named after sha256 of the txid
+    file_name = lambda tx: hashlib.sha256(bytes.fromhex(tx["txid"])).hexdigest() + ".json"
+    assert sorted(map(file_name, first)) == names[:3]
+    assert sorted(map(file_name, second)) == names[3:]
+    assert third == []
+    assert sorted(map(file_name, ({"txid": txid} for txid in seen))) == names[1:]
+    assert list(map(file_name, retried)) == names[:1]
+    assert bad_params["error"]["code"] == -8 and bad_body["error"]["code"] == -32700
+    assert "batch rejected" in batch_error
+    # Keep-alive connections are reused across polls
+    assert connections <= 2
+
+
+def test_raw_transaction_roundtrip():
+    name = sorted(os.listdir("mempool"))[0]
+    with open(os.path.join("mempool", name)) as f:
+        tx = json.load(f)
+    legacy = serialize_txn(tx)
+    witness = "".join(
+        to_compact_size(len(i["witness"])) + "".join(to_compact_size(len(item) // 2) + item for item in i["witness"])
+        for i in tx["vin"]
+    )
+    raw = RawTransaction.from_hex(legacy[:8] + "0001" + legacy[8:-8] + witness + legacy[-8:])
+
+    assert raw.is_segwit
+    assert hashlib.sha256(bytes.fromhex(raw.txid)).hexdigest() + ".json" == name
+    assert RawTransaction.from_hex(legacy).txid == raw.txid
+    assert raw.weight == transaction_weight_and_size(tx)[0]
+    parsed = raw.to_dict()
+    assert [i["witness"] for i in parsed["vin"]] == [i["witness"] for i in tx["vin"]]
+    assert [(o["value"], o["scriptpubkey"]) for o in parsed["vout"]] == [(o["value"], o["scriptpubkey"]) for o in tx["vout"]]
+    # Slices point into the original buffer rather than copies of it
+    assert raw.witnesses[0][0].obj is raw.buffer.obj
+
+
+def test_coinbase_template_splicing():
+    commitment = "ab" * 32
+    reward = block_subsidy(COINBASE_HEIGHT) + 6517
+    coinbase_hex, coinbase_txid = serialize_coinbase_transaction(commitment, reward=reward)
+    raw = RawTransaction.from_hex(coinbase_hex)
+    assert raw.txid == coinbase_txid
+    assert raw.outputs[0].value == reward == 625006517
+    # The BIP34 push carries the same height the subsidy and locktime checks use
+    script_sig = raw.inputs[0].script_sig.tobytes()
+    assert script_sig[0] == 3 and int.from_bytes(script_sig[1:4], "little") == COINBASE_HEIGHT == MEMPOOL_TIP_HEIGHT + 1
+    assert raw.outputs[1].script_pubkey.hex() == "6a24aa21a9ed" + commitment
+
+    rolled_hex, rolled_txid = serialize_coinbase_transaction(commitment, reward=reward, extranonce=b"\x01" * 8)
+    assert len(rolled_hex) == len(coinbase_hex) and rolled_txid != coinbase_txid
+    assert RawTransaction.from_hex(rolled_hex).inputs[0].script_sig.tobytes().endswith(b"\x01" * 8)
+
+
+def independent_transactions(count, skip=0):
+    # Mempool transactions whose parents are all confirmed
+    names = set(os.listdir("mempool"))
+    transactions = []
+    for name in sorted(names):
+        with open(os.path.join("mempool", name)) as f:
+            tx = json.load(f)
+        if all(hashlib.sha256(bytes.fromhex(i["txid"])).hexdigest() + ".json" not in names for i in tx["vin"]):
+            transactions.append(preprocess_transaction(tx))
+        if len(transactions) == skip + count:
+            return transactions[skip:]
+
+
+def test_verify_block_roundtrip():
+    transactions = independent_transactions(4)
+    header, txids, _, coinbase_hex, coinbase_txid = mine_block_with_transactions(transactions)
+
+    with tempfile.TemporaryDirectory() as tmp, BlockVerifier(workers=2) as verifier:
+        path = os.path.join(tmp, "output.txt")
+        with open(path, "w") as f:
+            f.write("\n".join([header, coinbase_hex, coinbase_txid] + txids) + "\n")
+        errors, total_weight, total_fee = verifier.verify(path)
+        assert errors == []
+        assert total_fee == sum(tx["fee"] for tx in transactions)
+
+        # Listing a transaction twice breaks the merkle root and double-spends its inputs
+        with open(path, "a") as f:
+            f.write(txids[0] + "\n")
+        errors, _, _ = verifier.verify(path)
+        assert any("Duplicate txid" in error for error in errors)
+        assert any("Merkle root" in error for error in errors)
+
+        # A transaction paying out more than it spends is rejected on its own
+        mempool_dir = os.path.join(tmp, "mempool")
+        os.mkdir(mempool_dir)
+        name = hashlib.sha256(bytes.fromhex(transactions[0]["txid"])).hexdigest() + ".json"
+        with open(os.path.join("mempool", name)) as f:
+            overspend = json.load(f)
+        overspend["vout"][0]["value"] += sum(i["prevout"]["value"] for i in overspend["vin"])
+        overspend = preprocess_transaction(overspend)
+        name = hashlib.sha256(bytes.fromhex(overspend["txid"])).hexdigest() + ".json"
+        with open(os.path.join(mempool_dir, name), "w") as f:
+            json.dump({k: v for k, v in overspend.items() if k in ("version", "locktime", "vin", "vout")}, f)
+        header, txids, _, coinbase_hex, coinbase_txid = mine_block_with_transactions([overspend])
+        with open(path, "w") as f:
+            f.write("\n".join([header, coinbase_hex, coinbase_txid] + txids) + "\n")
+        with BlockVerifier(mempool_dir, workers=1) as overspend_verifier:
+            errors, _, total_fee = overspend_verifier.verify(path)
+        assert total_fee < 0
+        assert errors == [f"Transaction {overspend['txid']} is invalid: negative-fee"]
+
+
+def test_merkle_branch_matches_root():
+    txids = [hashlib.sha256(bytes([i])).hexdigest() for i in range(7)]
+    assert merkle_root_from_branch(txids[0], calculate_merkle_branch(txids)) == calculate_merkle_root(txids)
+
+
+def test_work_server_distributes_jobs():
+    first, second = independent_transactions(3), independent_transactions(3, skip=3)
+
+    async def scenario():
+        # The first job cannot be solved, so the block always comes from the second one
+        async with WorkServer(target="0" * 64) as server:
+            await server.set_template(first)
+            workers = [asyncio.to_thread(run_worker, server.host, server.port, f"w{i}") for i in range(2)]
+            workers = [asyncio.ensure_future(worker) for worker in workers]
+            while sum(stats.accepted for stats in server.workers.values()) == 0:
+                await asyncio.sleep(0.01)
+            # A new template makes the first job stale
+            server.target = "0000ffff" + "0" * 56
+            await server.set_template(second)
+            await asyncio.wait_for(server.block_found.wait(), timeout=60)
+            report = server.report()
+        await asyncio.gather(*workers)
+        return server.solution, report
+
+    solution, report = asyncio.run(scenario())
+    header, coinbase_hex, coinbase_txid, txids = solution
+    validate_header(header, "0000ffff" + "0" * 56)
+    assert txids == [tx["txid"] for tx in second]
+    assert bytes.fromhex(header)[36:68].hex() == calculate_merkle_root([coinbase_txid] + txids)
+    assert set(report) == {"w0", "w1"}
+    assert all(stats["hashrate"] > 0 for stats in report.values() if stats["accepted"])
+
+
+def test_work_server_rejects_bad_shares():
+    async def scenario():
+        # Every hash is a share and none solves the block
+        async with WorkServer(target="0" * 64, share_target="f" * 64) as server:
+            await server.set_template(independent_transactions(2))
+            reader, writer = await asyncio.open_connection(server.host, server.port)
+
+            async def call(method, params):
+                writer.write(json.dumps({"id": 1, "method": method, "params": params}).encode() + b"\n")
+                return json.loads(await reader.readline())["error"]
+
+            await call("mining.subscribe", ["w0"])
+            # The subscribe reply is followed by a notify carrying this worker's extranonce range
+            job = json.loads(await reader.readline())["params"]
+            job_id, start, end = job["job_id"], job["extranonce_start"], job["extranonce_end"]
+            share = {"job_id": job_id, "extranonce": start, "nonce": 7}
+            errors = [
+                await call("mining.submit", share),
+                await call("mining.submit", share),
+                await call("mining.submit", dict(share, extranonce=end)),
+                await call("mining.submit", dict(share, extranonce=-1)),
+                await call("mining.submit", dict(share, nonce=1 << 40)),
+                await call("mining.submit", dict(share, nonce="7")),
+                await call("mining.submit", [job_id, start, 7]),
+            ]
+            # A line that is not JSON gets an error reply and the connection stays usable
+            writer.write(b"{not json\n")
+            errors.append(json.loads(await reader.readline())["error"])
+            errors.append(await call("mining.submit", dict(share, nonce=8)))
+            writer.close()
+            return errors, server.report()
+
+    errors, report = asyncio.run(scenario())
+    assert errors == [
+        None, "duplicate-share", "extranonce-not-assigned", "extranonce-not-assigned", "invalid-params",
+        "invalid-params", "invalid-params", "invalid-request", None,
+    ]
+    assert report["w0"]["accepted"] == 2 and report["w0"]["rejected"] == 6
+
+
+def test_cli_quick_commands_stay_lazy():
+    header = "00" * 80
+    script = (
+        "import sys, cli\n"
+        f"status = cli.main(['verify', '--header', '{header}'])\n"
+        "heavy = {'asyncio', 'coincurve', 'concurrent.futures', 'verify_block', 'main'} & set(sys.modules)\n"
+        "assert not heavy, heavy\n"
+        "sys.exit(status)\n"
+    )
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True)
+    # An all-zero header does not meet the target, but the check itself must run without the heavy imports
+    assert result.returncode == 1, result.stderr
+    assert "Header is invalid" in result.stdout
+    assert "[verify] startup" in result.stderr
+
+
+def test_policy_filter_vectorized_rules():
+    def policy_txn(txid, fee, value=10000, locktime=0, sequence=0xFFFFFFFF):
+        tx = make_txn(txid, [("aa" * 32, 0)], fee=fee, sequence=sequence)
+        tx["locktime"] = locktime
+        tx["vin"][0]["prevout"] = {"value": value + fee}
+        tx["vout"][0].update(value=value, scriptpubkey_type="v0_p2wpkh")
+        return tx
+
+    transactions = [
+        policy_txn("11" * 32, fee=500),
+        policy_txn("22" * 32, fee=10),
+        policy_txn("33" * 32, fee=500, value=100),
+        policy_txn("44" * 32, fee=500, locktime=900000, sequence=0xFFFFFFFD),
+        policy_txn("55" * 32, fee=500, locktime=900000),
+    ]
+    columns = MempoolColumns(transactions)
+    assert list(columns.fee) == [500, 10, 500, 500, 500]
+    assert list(columns.weight) == [transaction_weight_and_size(tx)[0] for tx in transactions]
+
+    kept, reasons = filter_transactions(transactions)
+    # A locktime does not bind when every input is final
+    assert [tx["txid"] for tx in kept] == ["11" * 32, "55" * 32]
+    assert reasons == {"min-relay-fee-not-met": 1, "dust": 1, "non-final": 1}
+
+    # A dust output sinks the parent, and the children spending its other output go with it
+    parent = policy_txn("66" * 32, fee=500)
+    parent["vout"].append({"value": 100, "scriptpubkey": "00" * 22, "scriptpubkey_type": "v0_p2wpkh"})
+    parent["vin"][0]["prevout"]["value"] += 100
+    child, grandchild = policy_txn("77" * 32, fee=500), policy_txn("88" * 32, fee=500)
+    child["vin"][0]["txid"], grandchild["vin"][0]["txid"] = "66" * 32, "77" * 32
+    rejected, dropped = Counter(), set()
+    kept = iter_policy_filtered([grandchild, transactions[0], child, parent], rejected=rejected, dropped=dropped)
+    assert [tx["txid"] for tx in kept] == ["11" * 32]
+    assert rejected == {"dust": 1, "rejected-parent": 2}
+    assert dropped == {"66" * 32, "77" * 32, "88" * 32}
+    # Across chunks, descendants that come after the parent are dropped; earlier ones are reported via `dropped`
+    dropped = set()
+    kept = iter_policy_filtered([child, parent, grandchild], chunk_size=1, dropped=dropped)
+    assert [tx["txid"] for tx in kept] == ["77" * 32, "88" * 32]
+    assert dropped == {"66" * 32}
+
+
+def test_block_template_optimizer_beats_greedy():
+    def sized(txid, spends, fee, weight):
+        tx = make_txn(txid, spends, fee)
+        tx["weight"] = weight
+        return tx
+
+    transactions = [
+        sized("11" * 32, [("aa" * 32, 0)], fee=200, weight=200),
+        sized("22" * 32, [("11" * 32, 0)], fee=8000, weight=200),  # pays for its parent
+        sized("33" * 32, [("cc" * 32, 0)], fee=3300, weight=300),
+        sized("44" * 32, [("bb" * 32, 0)], fee=8000, weight=800),
+        sized("55" * 32, [("bb" * 32, 0)], fee=7900, weight=800),  # double-spends 44..
+        sized("66" * 32, [("dd" * 32, 0)], fee=1000, weight=200),
+    ]
+    optimizer = BlockTemplateOptimizer(transactions, max_weight=1400)
+    template = [tx["txid"] for tx in optimizer.optimize(budget_ms=1000)]
+
+    # Greedy takes the small high-feerate 33.. and strands 800 WU; swapping it out makes room for 44..
+    assert optimizer.greedy_fee == 12500
+    assert optimizer.total_fee == 17200 and optimizer.total_weight <= 1400
+    assert set(template) == {"11" * 32, "22" * 32, "44" * 32, "66" * 32}
+    assert template.index("11" * 32) < template.index("22" * 32)
+
+    # With the budget spent by the greedy pass, no fill or swap is started
+    expired = BlockTemplateOptimizer(transactions, max_weight=1400)
+    expired.optimize(budget_ms=0)
+    assert (expired.total_fee, expired.fills, expired.swaps) == (12500, 0, 0)
+
+    # Packages whose members spend the same outpoint are never taken whole
+    conflicted = [
+        sized("11" * 32, [("cc" * 32, 1)], fee=100, weight=200),
+        sized("22" * 32, [("cc" * 32, 1)], fee=100, weight=200),
+        sized("33" * 32, [("11" * 32, 0), ("22" * 32, 0)], fee=10000, weight=200),  # needs both double-spends
+        sized("44" * 32, [("dd" * 32, 0)], fee=500, weight=200),
+        sized("55" * 32, [("44" * 32, 0), ("dd" * 32, 0)], fee=5000, weight=200),  # respends its parent's input
+    ]
+    for budget_ms in (0, 50):
+        template = BlockTemplateOptimizer(conflicted).optimize(budget_ms=budget_ms)
+        outpoints = [(i["txid"], i["vout"]) for tx in template for i in tx["vin"]]
+        assert len(outpoints) == len(set(outpoints))
+        assert {tx["txid"] for tx in template} in ({"11" * 32, "44" * 32}, {"22" * 32, "44" * 32})
+
+
+def test_validation_scheduler_releases_children_after_parents():
+    def funded(txid, spends, value):
+        tx = make_txn(txid, spends, fee=0)
+        for input in tx["vin"]:
+            input["prevout"] = {"value": value, "scriptpubkey": "00" * 22, "scriptpubkey_type": "v0_p2wsh"}
+        return tx
+
+    transactions = [
+        funded("22" * 32, [("11" * 32, 0)], value=1000),  # listed before its parent
+        funded("11" * 32, [("aa" * 32, 0)], value=2000),
+        funded("33" * 32, [("bb" * 32, 0)], value=500),  # spends more than it has
+        funded("44" * 32, [("33" * 32, 0)], value=1000),
+        funded("55" * 32, [("11" * 32, 0)], value=999),  # claims the wrong prevout value
+    ]
+    scheduler = ValidationScheduler(workers=2)
+    valid = scheduler.run(transactions)
+
+    assert [tx["txid"] for tx in valid] == ["22" * 32, "11" * 32]
+    assert scheduler.failures == {"33" * 32: "negative-fee", "44" * 32: "invalid-parent", "55" * 32: "prevout-mismatch"}
+    # The child of the failed transaction and the mismatched spend never reach a worker
+    assert scheduler.validated == 3 and scheduler.skipped == 1
+    assert 0 <= scheduler.utilisation <= 1
+
+
+def test_utxo_store_resolves_applies_and_undoes():
+    def spending(txid, spends, value=None):
+        tx = make_txn(txid, spends, fee=0)
+        if value is not None:
+            for input in tx["vin"]:
+                input["prevout"] = {"value": value, "scriptpubkey": "00" * 22}
+        return tx
+
+    with UTXOStore(":memory:") as store:
+        store.import_prevouts([spending("11" * 32, [("aa" * 32, 0), ("bb" * 32, 0)], value=2000)], height=100)
+        assert len(store) == 2 and store.tip == 100
+
+        # Prevouts are filled in from the store or from in-group parents, and checked when embedded
+        group = [
+            spending("22" * 32, [("aa" * 32, 0)]),
+            spending("33" * 32, [("22" * 32, 0)]),
+            spending("44" * 32, [("bb" * 32, 0)], value=5000),
+            spending("55" * 32, [("cc" * 32, 0)]),
+            spending("66" * 32, [("55" * 32, 0)]),
+        ]
+        resolved, rejected = resolve_prevouts(group, store)
+        assert [tx["txid"] for tx in resolved] == ["22" * 32, "33" * 32]
+        assert resolved[0]["vin"][0]["prevout"] == {"scriptpubkey": "00" * 22, "scriptpubkey_type": "unknown", "value": 2000}
+        assert resolved[1]["vin"][0]["prevout"]["value"] == 1000
+        assert rejected == {"missing-inputs": 2, "prevout-mismatch": 1}
+
+        # Streamed one per chunk, a child that arrives before its parent waits for it
+        stream = [
+            spending("33" * 32, [("22" * 32, 0)]),
+            spending("66" * 32, [("55" * 32, 0)]),
+            spending("22" * 32, [("aa" * 32, 0)]),
+            spending("55" * 32, [("cc" * 32, 0)]),
+        ]
+        streamed_rejected = Counter()
+        streamed = iter_resolved_prevouts(stream, store, chunk_size=1, rejected=streamed_rejected)
+        assert [tx["txid"] for tx in streamed] == ["22" * 32, "33" * 32]
+        assert streamed_rejected == {"missing-inputs": 2}
+
+        # A block creating and spending a coin internally rolls back cleanly
+        assert store.apply_block(resolved) == 101
+        assert store.get("aa" * 32, 0) is None and store.get("22" * 32, 0) is None
+        assert store.get("33" * 32, 0).height == 101
+        try:
+            store.apply_block(resolved)
+            raise AssertionError("double spend was applied")
+        except ValueError:
+            pass
+        assert store.undo_block() == 100
+        assert store.get("aa" * 32, 0).value == 2000 and store.get("33" * 32, 0) is None
+        assert len(store) == 2 and store.cache_stats()["hits"] > 0
+
+    # Resolving against a mistyped path fails instead of creating an empty store
+    with tempfile.TemporaryDirectory() as tmp:
+        missing = os.path.join(tmp, "typo.sqlite")
+        try:
+            UTXOStore(missing, create=False)
+            raise AssertionError("a missing store was opened")
+        except ValueError:
+            pass
+        assert not os.path.exists(missing)
+
+
+def test_key_caches_hit_on_reused_pubkey():
+    # Inputs 0 and 2 are P2WPKH spends signed by the same key
+    with open(os.path.join("mempool", "00c4387b3de5d0376b3df4db81a6016b584aad10c5aff619d15627e43ca4d697.json")) as f:
+        transaction = json.load(f)
+    load_public_key.cache_clear()
+    to_hash160.cache_clear()
+    assert validate_input(transaction, 0) and validate_input(transaction, 2)
+    stats = key_cache_stats()
+    assert stats["pubkey"]["hits"] == 1 and stats["pubkey"]["misses"] == 1
+    assert stats["hash160"]["hits"] == 1 and stats["hash160"]["misses"] == 1
+
+
 if __name__ == "__main__":
     test_merkle_root_basic()
     test_header_validation_length()
+    test_mempool_evicts_lowest_descendant_feerate()
+    test_mempool_floor_decays_and_rejects_are_bounded()
+    test_mempool_bip125_replacement()
+    test_rpc_source_delta_polling()
+    test_raw_transaction_roundtrip()
+    test_coinbase_template_splicing()
+    test_verify_block_roundtrip()
+    test_merkle_branch_matches_root()
+    test_work_server_distributes_jobs()
+    test_work_server_rejects_bad_shares()
+    test_cli_quick_commands_stay_lazy()
+    test_policy_filter_vectorized_rules()
+    test_block_template_optimizer_beats_greedy()
+    test_validation_scheduler_releases_children_after_parents()
+    test_key_caches_hit_on_reused_pubkey()
+    test_utxo_store_resolves_applies_and_undoes()
     print("smoke tests passed")
 
 
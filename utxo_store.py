@@ -0,0 +1,430 @@
+import os
+import sqlite3
+from urllib.request import pathname2url
+from collections import Counter, OrderedDict, namedtuple
+from _utils.hash_utils import hash256
+from _utils.raw_transaction import RawTransaction
+from _utils.transaction_utils import serialize_txn, to_reverse_bytes_string, MEMPOOL_TIP_HEIGHT
+
+# Constants
+UTXO_DB = "utxo.sqlite"
+UTXO_CACHE_SIZE = 200000  # coins kept in memory
+LOOKUP_CHUNK_SIZE = 400  # outpoints per batched SELECT (two bound variables each)
+RESOLVE_CHUNK_SIZE = 4096  # transactions resolved per batch of lookups when streaming
+NULL_TXID = "00" * 32
+COINBASE_VOUT = 0xFFFFFFFF
+
+Coin = namedtuple("Coin", ["value", "script", "height"])
+
+
+def ensure_txid(transaction):
+    # Mempool files carry no txid; resolution needs it before pre-processing would add it
+    if not transaction.get("txid"):
+        transaction["txid"] = to_reverse_bytes_string(hash256(serialize_txn(transaction)))
+    return transaction["txid"]
+
+
+def classify_script(script):
+    """
+    Name the standard output type of a hex scriptPubKey, using the explorer's type names.
+    """
+    if len(script) == 50 and script.startswith("76a914") and script.endswith("88ac"):
+        return "p2pkh"
+    if len(script) == 46 and script.startswith("a914") and script.endswith("87"):
+        return "p2sh"
+    if len(script) == 44 and script.startswith("0014"):
+        return "v0_p2wpkh"
+    if len(script) == 68 and script.startswith("0020"):
+        return "v0_p2wsh"
+    if len(script) == 68 and script.startswith("5120"):
+        return "v1_p2tr"
+    if script.startswith("6a"):
+        return "op_return"
+    return "unknown"
+
+
+class UTXOStore:
+    """
+    The unspent outputs of the chain, kept in SQLite and keyed by outpoint.
+
+    Recently used coins are held in an in-memory LRU cache, so repeated lookups never touch the database.
+    Lookups for a whole group of transactions are batched into a few queries joined against a VALUES list. Each applied
+    block records an undo log (coins it spent and outpoints it created), so the tip block can be rolled back.
+    """
+
+    def __init__(self, path=UTXO_DB, cache_size=UTXO_CACHE_SIZE, create=True):
+        """
+        :param path: SQLite database file (":memory:" for a throwaway store).
+        :param cache_size: Number of coins kept in the in-memory cache.
+        :param create: Create the database if it does not exist; otherwise only open an existing one.
+        :raises ValueError: If `create` is False and the database does not exist.
+        """
+        self.path = path
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        if create or path == ":memory:":
+            self._db = sqlite3.connect(path)
+        else:
+            try:
+                self._db = sqlite3.connect(f"file:{pathname2url(os.path.abspath(path))}?mode=rw", uri=True)
+            except sqlite3.OperationalError:
+                raise ValueError(f"UTXO store {path} does not exist (create it with `cli.py utxo import`)")
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS utxos (
+                txid BLOB NOT NULL, vout INTEGER NOT NULL, value INTEGER NOT NULL, script BLOB NOT NULL,
+                height INTEGER NOT NULL, PRIMARY KEY (txid, vout)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS undo (
+                height INTEGER NOT NULL, txid BLOB NOT NULL, vout INTEGER NOT NULL, value INTEGER,
+                script BLOB, coin_height INTEGER, created INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS undo_height ON undo (height);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            """
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM utxos").fetchone()[0]
+
+    def close(self):
+        self._db.close()
+
+    @property
+    def tip(self):
+        """
+        Height of the last applied block, or None for an empty store.
+        """
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'tip'").fetchone()
+        return row[0] if row else None
+
+    def _set_tip(self, height):
+        self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('tip', ?)", (height,))
+
+    def _remember(self, outpoint, coin):
+        self._cache[outpoint] = coin
+        self._cache.move_to_end(outpoint)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def get(self, txid, vout):
+        return self.get_many([(txid, vout)]).get((txid, vout))
+
+    def get_many(self, outpoints):
+        """
+        Look up many outpoints at once; cache misses are fetched with batched queries.
+
+        :param outpoints: An iterable of (txid hex, vout) pairs.
+        :return: A dictionary from outpoint to Coin; unspent-set misses are left out.
+        """
+        found = {}
+        missing = []
+        for outpoint in dict.fromkeys(outpoints):
+            coin = self._cache.get(outpoint)
+            if coin is not None:
+                self._cache.move_to_end(outpoint)
+                found[outpoint] = coin
+            else:
+                missing.append(outpoint)
+        self.hits += len(found)
+        self.misses += len(missing)
+
+        for start in range(0, len(missing), LOOKUP_CHUNK_SIZE):
+            chunk = missing[start:start + LOOKUP_CHUNK_SIZE]
+            values = ", ".join("(?, ?)" for _ in chunk)
+            parameters = [item for txid, vout in chunk for item in (bytes.fromhex(txid), vout)]
+            # Joining against the VALUES list keeps every probe a primary-key search; a row-value IN would scan
+            rows = self._db.execute(
+                f"WITH wanted (txid, vout) AS (VALUES {values}) "
+                "SELECT utxos.txid, utxos.vout, value, script, height FROM wanted CROSS JOIN utxos "
+                "ON utxos.txid = wanted.txid AND utxos.vout = wanted.vout",
+                parameters,
+            )
+            for txid, vout, value, script, height in rows:
+                outpoint = (txid.hex(), vout)
+                coin = Coin(value, script.hex(), height)
+                self._remember(outpoint, coin)
+                found[outpoint] = coin
+        return found
+
+    def add_coins(self, coins):
+        """
+        Insert (or overwrite) coins outside of any block, e.g. when importing a snapshot.
+
+        :param coins: An iterable of ((txid, vout), Coin) pairs.
+        :return: The number of coins written.
+        """
+        rows = []
+        for (txid, vout), coin in coins:
+            rows.append((bytes.fromhex(txid), vout, coin.value, bytes.fromhex(coin.script), coin.height))
+            self._cache.pop((txid, vout), None)
+        with self._db:
+            self._db.executemany("INSERT OR REPLACE INTO utxos VALUES (?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def import_prevouts(self, transactions, height=MEMPOOL_TIP_HEIGHT):
+        """
+        Seed the store from the prevouts embedded in mempool transactions.
+
+        Outputs of transactions in the same set are unconfirmed and are not imported. Where two transactions
+        describe the same outpoint differently, the first description wins and the other will fail to resolve.
+
+        :param height: Height recorded for the imported coins and as the store's tip.
+        :return: The number of coins imported.
+        """
+        in_set = {ensure_txid(tx) for tx in transactions}
+        coins = {}
+        for tx in transactions:
+            for input in tx["vin"]:
+                outpoint = (input["txid"], input["vout"])
+                prevout = input.get("prevout")
+                if prevout is None or input["txid"] in in_set or outpoint in coins:
+                    continue
+                coins[outpoint] = Coin(prevout["value"], prevout["scriptpubkey"], height)
+        count = self.add_coins(coins.items())
+        with self._db:
+            self._set_tip(height)
+        return count
+
+    def apply_block(self, transactions, height=None):
+        """
+        Spend the inputs and add the outputs of a block's transactions (coinbase included), in block order.
+
+        :param transactions: Transaction dictionaries with 'txid', 'vin' and 'vout'.
+        :param height: Height of the block (defaults to one above the tip).
+        :return: The new tip height.
+        :raises ValueError: If the block spends a coin that is not in the store; nothing is applied then.
+        """
+        if height is None:
+            height = (self.tip or 0) + 1
+        spent_in_block = set()
+        created = {}
+        spends = [
+            (input["txid"], input["vout"])
+            for tx in transactions
+            for input in tx["vin"]
+            if (input["txid"], input["vout"]) != (NULL_TXID, COINBASE_VOUT)
+        ]
+        stored = self.get_many(spends)
+
+        undo_rows, removed, added = [], [], []
+        for tx in transactions:
+            for input in tx["vin"]:
+                outpoint = (input["txid"], input["vout"])
+                if outpoint == (NULL_TXID, COINBASE_VOUT):
+                    continue
+                coin = created.pop(outpoint, None) or (None if outpoint in spent_in_block else stored.get(outpoint))
+                if coin is None:
+                    raise ValueError(f"Block spends missing coin {outpoint[0]}:{outpoint[1]}")
+                spent_in_block.add(outpoint)
+                undo_rows.append((height, bytes.fromhex(outpoint[0]), outpoint[1], coin.value,
+                                  bytes.fromhex(coin.script), coin.height, 0))
+                removed.append(outpoint)
+            for vout, output in enumerate(tx["vout"]):
+                # Provably unspendable outputs never enter the set
+                if output["scriptpubkey"].startswith("6a"):
+                    continue
+                outpoint = (tx["txid"], vout)
+                coin = Coin(output["value"], output["scriptpubkey"], height)
+                created[outpoint] = coin
+                undo_rows.append((height, bytes.fromhex(tx["txid"]), vout, None, None, None, 1))
+                added.append((outpoint, coin))
+
+        with self._db:
+            self._db.executemany("INSERT INTO undo VALUES (?, ?, ?, ?, ?, ?, ?)", undo_rows)
+            self._db.executemany(
+                "DELETE FROM utxos WHERE txid = ? AND vout = ?",
+                [(bytes.fromhex(txid), vout) for txid, vout in removed],
+            )
+            self._db.executemany(
+                "INSERT OR REPLACE INTO utxos VALUES (?, ?, ?, ?, ?)",
+                [(bytes.fromhex(txid), vout, coin.value, bytes.fromhex(coin.script), coin.height)
+                 for (txid, vout), coin in added if (txid, vout) in created],
+            )
+            self._set_tip(height)
+        for outpoint in removed:
+            self._cache.pop(outpoint, None)
+        for outpoint, coin in created.items():
+            self._remember(outpoint, coin)
+        return height
+
+    def undo_block(self):
+        """
+        Roll back the tip block: remove the coins it created and restore the coins it spent.
+
+        :return: The new tip height.
+        :raises ValueError: If the tip has no undo data.
+        """
+        height = self.tip
+        rows = self._db.execute(
+            "SELECT txid, vout, value, script, coin_height, created FROM undo WHERE height = ? ORDER BY rowid DESC",
+            (height,),
+        ).fetchall()
+        if height is None or not rows:
+            raise ValueError("No undo data for the tip block")
+
+        with self._db:
+            # Newest first, so a coin created and spent within the block ends up removed
+            for txid, vout, value, script, coin_height, created in rows:
+                self._cache.pop((txid.hex(), vout), None)
+                if created:
+                    self._db.execute("DELETE FROM utxos WHERE txid = ? AND vout = ?", (txid, vout))
+                else:
+                    self._db.execute("INSERT OR REPLACE INTO utxos VALUES (?, ?, ?, ?, ?)",
+                                     (txid, vout, value, script, coin_height))
+            self._db.execute("DELETE FROM undo WHERE height = ?", (height,))
+            self._set_tip(height - 1)
+        return height - 1
+
+    def cache_stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._cache),
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def read_block_transactions(output_path, transactions):
+    """
+    Rebuild the transactions of a block written in the `output.txt` format, coinbase first.
+
+    :param output_path: Path to the mined block.
+    :param transactions: Transaction dictionaries to look the listed txids up in (e.g. the mempool).
+    :return: A list of transaction dictionaries in block order.
+    :raises ValueError: If a listed txid is not among the given transactions.
+    """
+    with open(output_path, "r") as f:
+        lines = [line.strip() for line in f if line.strip()]
+    by_txid = {ensure_txid(tx): tx for tx in transactions}
+    block = [RawTransaction.from_hex(lines[1]).to_dict()]
+    for txid in lines[3:]:
+        if txid not in by_txid:
+            raise ValueError(f"Block transaction {txid} is not in the mempool")
+        block.append(by_txid[txid])
+    return block
+
+
+def iter_resolved_prevouts(transactions, store, chunk_size=RESOLVE_CHUNK_SIZE, rejected=None):
+    """
+    Stream transactions through prevout resolution one chunk at a time.
+
+    Every input is resolved against the UTXO store, the outputs of the transactions already yielded and the
+    outputs of its own chunk. A prevout that is already embedded must match the coin it claims to spend; a
+    missing one is filled in with the coin's value, script and type. Only the created outpoints are carried
+    from chunk to chunk, never the transactions. A transaction whose parent has not arrived yet waits, together
+    with its descendants, and is retried with every later chunk. Once the stream ends, any still waiting are
+    dropped as missing inputs. Transactions that fail are dropped along with their descendants.
+
+    :param transactions: An iterable of transaction dictionaries (e.g. a whole mempool).
+    :param store: A UTXOStore holding the confirmed coins.
+    :param chunk_size: Number of transactions resolved per batch of store lookups.
+    :param rejected: Optional Counter that accumulates the rejection reasons.
+    """
+    created = {}
+    failed = set()
+    waiting = []
+
+    def resolve_chunk(chunk, final=False):
+        # Waiting transactions go after the chunk that may hold their parents
+        group = chunk + waiting
+        for tx in chunk:
+            ensure_txid(tx)
+        local = {
+            (tx["txid"], vout): Coin(output["value"], output["scriptpubkey"], None)
+            for tx in group
+            for vout, output in enumerate(tx["vout"])
+        }
+        coins = store.get_many(
+            (input["txid"], input["vout"])
+            for tx in group
+            for input in tx["vin"]
+            if (input["txid"], input["vout"]) not in created and (input["txid"], input["vout"]) not in local
+        )
+
+        reasons, unresolved = {}, set()
+        for tx in group:
+            for input in tx["vin"]:
+                if input["txid"] in failed:
+                    reasons[tx["txid"]] = "missing-inputs"
+                    break
+                outpoint = (input["txid"], input["vout"])
+                coin = created.get(outpoint) or local.get(outpoint) or coins.get(outpoint)
+                if coin is None:
+                    unresolved.add(tx["txid"])
+                    continue
+                prevout = input.get("prevout")
+                if prevout is None:
+                    input["prevout"] = {
+                        "scriptpubkey": coin.script,
+                        "scriptpubkey_type": classify_script(coin.script),
+                        "value": coin.value,
+                    }
+                elif prevout["value"] != coin.value or prevout["scriptpubkey"] != coin.script:
+                    reasons[tx["txid"]] = "prevout-mismatch"
+                    break
+        if final:
+            reasons.update((txid, "missing-inputs") for txid in unresolved if txid not in reasons)
+        unresolved.difference_update(reasons)
+
+        # Outputs of a dropped transaction will never exist, so its descendants go too; descendants of a
+        # transaction still waiting for its parent wait with it
+        spenders = {}
+        for tx in group:
+            for input in tx["vin"]:
+                spenders.setdefault(input["txid"], []).append(tx["txid"])
+        stack = list(reasons)
+        while stack:
+            for child in spenders.get(stack.pop(), []):
+                if child not in reasons:
+                    reasons[child] = "missing-inputs"
+                    unresolved.discard(child)
+                    stack.append(child)
+        stack = list(unresolved)
+        while stack:
+            for child in spenders.get(stack.pop(), []):
+                if child not in reasons and child not in unresolved:
+                    unresolved.add(child)
+                    stack.append(child)
+
+        failed.update(reasons)
+        if rejected is not None:
+            rejected.update(reasons.values())
+        waiting[:] = [tx for tx in group if tx["txid"] in unresolved]
+        resolved = [tx for tx in group if tx["txid"] not in reasons and tx["txid"] not in unresolved]
+        for tx in resolved:
+            for vout, output in enumerate(tx["vout"]):
+                created[(tx["txid"], vout)] = local[(tx["txid"], vout)]
+        return resolved
+
+    chunk = []
+    for tx in transactions:
+        chunk.append(tx)
+        if len(chunk) == chunk_size:
+            yield from resolve_chunk(chunk)
+            chunk = []
+    yield from resolve_chunk(chunk, final=True)
+
+
+def resolve_prevouts(transactions, store):
+    """
+    Resolve every input's prevout against the UTXO store and the group's own outputs.
+
+    :param transactions: A group of transaction dictionaries with 'txid' (e.g. a whole mempool).
+    :param store: A UTXOStore holding the confirmed coins.
+    :return: A tuple of the resolved transactions (in order) and a Counter of rejection reasons.
+    """
+    rejected = Counter()
+    resolved = list(iter_resolved_prevouts(transactions, store, max(1, len(transactions)), rejected))
+    return resolved, rejected
@@ -0,0 +1,184 @@
+import os
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from check_adress import key_cache_stats, validate_input
+from mine_block_script import get_fee, is_valid_transaction
+
+# Constants
+VALIDATION_BATCH_SIZE = 32  # transactions per task sent to a worker
+TASKS_PER_WORKER = 2  # tasks kept queued per worker so none idles between batches
+
+
+def validate_transaction(transaction):
+    """
+    Run the checks that need nothing but the transaction itself (and its prevouts).
+
+    :param transaction: A pre-processed transaction dictionary with prevout data.
+    :return: None if the transaction passes, otherwise the reason it was rejected.
+    """
+    if not transaction["vin"] or not transaction["vout"]:
+        return "empty"
+    if not is_valid_transaction(transaction):
+        return "invalid"
+    if get_fee(transaction) < 0:
+        return "negative-fee"
+    for index in range(len(transaction["vin"])):
+        try:
+            if validate_input(transaction, index) is False:
+                return "bad-signature"
+        except (ValueError, IndexError, KeyError):
+            return "bad-signature"
+    return None
+
+
+def validate_batch(transactions):
+    """
+    Validate a batch of transactions in a worker process.
+
+    :return: A tuple of (worker pid, CPU seconds spent validating, list of (txid, rejection reason or None),
+             the worker's cumulative key cache statistics).
+    """
+    # CPU time rather than wall time, so oversubscribed cores do not count as busy twice
+    started = time.process_time()
+    results = [(tx["txid"], validate_transaction(tx)) for tx in transactions]
+    return os.getpid(), time.process_time() - started, results, key_cache_stats()
+
+
+class ValidationScheduler:
+    """
+    Validates a set of transactions on a process pool without breaking parent/child chains.
+
+    Transactions spending in-set outputs form a DAG. Only transactions whose in-set parents have all passed are
+    handed to the workers, and a child is released only once its prevouts have been checked against the parent's
+    actual outputs. When a transaction fails, its descendants are rejected on the spot without being sent to a
+    worker. Worker CPU time is summed so the run can report how much of the pool it kept busy.
+    """
+
+    def __init__(self, workers=None, batch_size=VALIDATION_BATCH_SIZE):
+        """
+        :param workers: Number of worker processes (defaults to the CPU count).
+        :param batch_size: Largest number of transactions sent to a worker per task.
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.failures = {}
+        self.validated = 0
+        self.skipped = 0
+        self.busy_seconds = 0.0
+        self.wall_seconds = 0.0
+        self.busy_by_worker = Counter()
+        self._worker_cache_stats = {}
+
+    @property
+    def utilisation(self):
+        """
+        Fraction of the pool's capacity (workers x wall time) spent validating on a CPU.
+        """
+        capacity = self.workers * self.wall_seconds
+        return self.busy_seconds / capacity if capacity else 0.0
+
+    @property
+    def cache_stats(self):
+        """
+        Key cache hits and misses summed over the workers (each process has its own caches).
+        """
+        stats = {}
+        for name in ("pubkey", "hash160"):
+            hits = sum(worker[name]["hits"] for worker in self._worker_cache_stats.values())
+            misses = sum(worker[name]["misses"] for worker in self._worker_cache_stats.values())
+            lookups = hits + misses
+            stats[name] = {"hits": hits, "misses": misses, "hit_rate": hits / lookups if lookups else 0.0}
+        return stats
+
+    def run(self, transactions):
+        """
+        Validate the transactions, parents before children.
+
+        :param transactions: Pre-processed transaction dictionaries; parents outside the list are assumed
+                             confirmed.
+        :return: The transactions that passed, in their original order.
+        """
+        started = time.perf_counter()
+        by_txid = {tx["txid"]: tx for tx in transactions}
+        children = {txid: [] for txid in by_txid}
+        waiting = {}
+        for txid, tx in by_txid.items():
+            parents = {input["txid"] for input in tx["vin"] if input["txid"] in by_txid}
+            waiting[txid] = len(parents)
+            for parent in parents:
+                children[parent].append(txid)
+
+        passed = set()
+        ready = deque(txid for txid, count in waiting.items() if count == 0)
+        in_flight = set()
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            while ready or in_flight:
+                # Smaller batches when little is ready, so a short frontier still spreads across the pool
+                while ready and len(in_flight) < self.workers * TASKS_PER_WORKER:
+                    size = max(1, min(self.batch_size, len(ready) // self.workers))
+                    batch = [by_txid[ready.popleft()] for _ in range(min(size, len(ready)))]
+                    in_flight.add(executor.submit(validate_batch, batch))
+
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pid, busy, results, cache_stats = future.result()
+                    self._worker_cache_stats[pid] = cache_stats
+                    self.busy_seconds += busy
+                    self.busy_by_worker[pid] += busy
+                    self.validated += len(results)
+                    for txid, reason in results:
+                        if reason is not None:
+                            self._reject(txid, reason, children)
+                            continue
+                        passed.add(txid)
+                        for child in children[txid]:
+                            if child in self.failures:
+                                continue
+                            if not self._prevouts_match(by_txid[child], by_txid[txid]):
+                                self._reject(child, "prevout-mismatch", children)
+                                continue
+                            waiting[child] -= 1
+                            if waiting[child] == 0:
+                                ready.append(child)
+
+        self.wall_seconds = time.perf_counter() - started
+        return [tx for tx in transactions if tx["txid"] in passed]
+
+    @staticmethod
+    def _prevouts_match(child, parent):
+        for input in child["vin"]:
+            if input["txid"] != parent["txid"]:
+                continue
+            if input["vout"] >= len(parent["vout"]):
+                return False
+            output = parent["vout"][input["vout"]]
+            prevout = input.get("prevout")
+            if prevout is not None and (
+                prevout["value"] != output["value"] or prevout["scriptpubkey"] != output["scriptpubkey"]
+            ):
+                return False
+        return True
+
+    def _reject(self, txid, reason, children):
+        self.failures[txid] = reason
+        stack = list(children[txid])
+        while stack:
+            descendant = stack.pop()
+            if descendant in self.failures:
+                continue
+            self.failures[descendant] = "invalid-parent"
+            self.skipped += 1
+            stack.extend(children[descendant])
+
+    def report(self):
+        reasons = Counter(self.failures.values())
+        caches = ", ".join(
+            f"{name} cache {stats['hits']} hits / {stats['misses']} misses ({stats['hit_rate']:.0%})"
+            for name, stats in self.cache_stats.items()
+        )
+        return (
+            f"Validated {self.validated} transactions on {self.workers} workers in {self.wall_seconds * 1000:.0f} ms: "
+            f"{len(self.failures)} rejected {dict(reasons)}, {self.skipped} skipped behind invalid parents, "
+            f"utilisation {self.utilisation:.0%}; {caches}"
+        )
@@ -0,0 +1,191 @@
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from mine_block_script import get_fee, validate_header, calculate_merkle_root
+from validation_scheduler import validate_transaction
+from _utils.hash_utils import hash256
+from _utils.raw_transaction import RawTransaction
+from _utils.transaction_utils import (
+    wtxid_serialize, to_compact_size, block_subsidy, script_number_push, COINBASE_HEIGHT,
+)
+
+# Constants
+MEMPOOL_DIR = "mempool"
+OUTPUT_FILE = "output.txt"
+DIFFICULTY_TARGET = "0000ffff00000000000000000000000000000000000000000000000000000000"
+MAX_BLOCK_WEIGHT = 4000000
+HEADER_WEIGHT = 80 * 4
+WITNESS_COMMITMENT_HEADER = "6a24aa21a9ed"
+
+
+def summarize_transaction(path):
+    """
+    Load one mempool file and compute everything the block checks need from it.
+
+    Runs in a worker process, so it only returns plain tuples. The transaction goes through the same
+    context-free checks as `cli.py validate` (scripts, signatures and a non-negative fee).
+
+    :param path: Path to the transaction JSON file.
+    :return: A tuple of (txid, wtxid, weight, fee, spent outpoints, rejection reason or None), or None if the
+             file cannot be read.
+    """
+    try:
+        with open(path, "r") as f:
+            transaction = json.load(f)
+        raw = RawTransaction.from_hex(wtxid_serialize(transaction))
+    except (OSError, ValueError, KeyError):
+        return None
+    transaction["txid"] = raw.txid
+    outpoints = [(input["txid"], input["vout"]) for input in transaction["vin"]]
+    return raw.txid, raw.wtxid, raw.weight, get_fee(transaction), outpoints, validate_transaction(transaction)
+
+
+class BlockVerifier:
+    """
+    Checks a mined `output.txt` against the mempool without the external grader.
+
+    Mempool files are indexed by name (the sha256 of the txid), so only the transactions a block actually
+    includes are loaded. Their summaries are computed on a process pool and kept in memory, so verifying many
+    blocks built from the same mempool only pays for each transaction once.
+    """
+
+    def __init__(self, mempool_dir=MEMPOOL_DIR, workers=None):
+        self.mempool_dir = mempool_dir
+        self.index = {
+            name[:-5]: os.path.join(mempool_dir, name) for name in os.listdir(mempool_dir) if name.endswith(".json")
+        }
+        self.summaries = {}
+        self._executor = ProcessPoolExecutor(max_workers=workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown()
+
+    def _in_mempool(self, txid):
+        return hashlib.sha256(bytes.fromhex(txid)).hexdigest() in self.index
+
+    def _load_summaries(self, txids):
+        missing = [txid for txid in dict.fromkeys(txids) if txid not in self.summaries]
+        paths = [self.index.get(hashlib.sha256(bytes.fromhex(txid)).hexdigest()) for txid in missing]
+        lookups = [(txid, path) for txid, path in zip(missing, paths) if path is not None]
+        chunksize = max(1, len(lookups) // 64)
+        results = self._executor.map(summarize_transaction, [path for _, path in lookups], chunksize=chunksize)
+        for (txid, _), summary in zip(lookups, results):
+            self.summaries[txid] = summary
+
+    def verify(self, output_path=OUTPUT_FILE):
+        """
+        Verify a block written in the `output.txt` format.
+
+        :param output_path: Path to the file holding the header, coinbase, coinbase txid and txids.
+        :return: A tuple of (list of error messages, total weight, total fee). The block is valid if the list
+                 is empty.
+        """
+        with open(output_path, "r") as f:
+            lines = [line.strip() for line in f if line.strip()]
+        if len(lines) < 3:
+            return ["Output file must hold a header, a coinbase transaction and its txid"], 0, 0
+        header, coinbase_hex, txids = lines[0], lines[1], lines[2:]
+        errors = []
+
+        try:
+            validate_header(header, DIFFICULTY_TARGET)
+        except ValueError as e:
+            errors.append(f"Header: {e}")
+
+        try:
+            coinbase = RawTransaction.from_hex(coinbase_hex)
+        except (ValueError, IndexError, KeyError):
+            return errors + ["Coinbase transaction cannot be parsed"], 0, 0
+        coinbase_input = coinbase.inputs[0] if len(coinbase.inputs) == 1 else None
+        if coinbase_input is None or any(coinbase_input.prev_txid) or coinbase_input.vout != 0xFFFFFFFF:
+            errors.append("Coinbase must have a single null-prevout input")
+        elif not coinbase_input.script_sig.tobytes().hex().startswith(script_number_push(COINBASE_HEIGHT)):
+            # BIP34: the subsidy below is only right if the coinbase commits to the same height
+            errors.append(f"Coinbase does not start with the BIP34 push of height {COINBASE_HEIGHT}")
+        if txids[0] != coinbase.txid:
+            errors.append(f"Coinbase txid mismatch: listed {txids[0]}, computed {coinbase.txid}")
+
+        if len(header) == 160 and bytes.fromhex(header)[36:68].hex() != calculate_merkle_root(txids):
+            errors.append("Merkle root in header does not match the listed txids")
+
+        seen = set()
+        for txid in txids:
+            if txid in seen:
+                errors.append(f"Duplicate txid in block: {txid}")
+            seen.add(txid)
+
+        self._load_summaries(txids[1:])
+        wtxids = ["00" * 32]
+        positions = {txid: position for position, txid in enumerate(txids)}
+        spent = {}
+        total_weight = HEADER_WEIGHT + len(to_compact_size(len(txids))) // 2 * 4 + coinbase.weight
+        total_fee = 0
+        for position, txid in enumerate(txids[1:], start=1):
+            summary = self.summaries.get(txid)
+            if summary is None:
+                errors.append(f"Transaction not found in mempool: {txid}")
+                continue
+            computed_txid, wtxid, weight, fee, outpoints, reason = summary
+            if computed_txid != txid:
+                errors.append(f"Transaction {txid} hashes to {computed_txid}")
+            if reason is not None:
+                errors.append(f"Transaction {txid} is invalid: {reason}")
+            wtxids.append(wtxid)
+            total_weight += weight
+            total_fee += fee
+
+            for outpoint in outpoints:
+                if outpoint in spent:
+                    errors.append(f"Outpoint {outpoint[0]}:{outpoint[1]} spent by both {spent[outpoint]} and {txid}")
+                spent[outpoint] = txid
+                parent_position = positions.get(outpoint[0])
+                if parent_position is not None and parent_position >= position:
+                    errors.append(f"Transaction {txid} appears before its parent {outpoint[0]}")
+                elif parent_position is None and self._in_mempool(outpoint[0]):
+                    errors.append(f"Transaction {txid} spends unconfirmed {outpoint[0]} missing from the block")
+
+        if total_weight > MAX_BLOCK_WEIGHT:
+            errors.append(f"Block weight {total_weight} exceeds {MAX_BLOCK_WEIGHT}")
+
+        coinbase_value = sum(output.value for output in coinbase.outputs)
+        if coinbase_value > block_subsidy(COINBASE_HEIGHT) + total_fee:
+            errors.append(f"Coinbase claims {coinbase_value}, more than subsidy plus fees")
+
+        commitments = [
+            output.script_pubkey.hex()[len(WITNESS_COMMITMENT_HEADER):]
+            for output in coinbase.outputs
+            if output.script_pubkey.hex().startswith(WITNESS_COMMITMENT_HEADER) and len(output.script_pubkey) == 38
+        ]
+        witness = coinbase.witnesses[0] if coinbase.witnesses else []
+        if not commitments or len(witness) != 1 or len(witness[0]) != 32:
+            errors.append("Coinbase lacks a witness commitment or witness reserved value")
+        elif commitments[-1] != hash256(calculate_merkle_root(wtxids) + witness[0].hex()):
+            errors.append("Witness commitment does not match the block's wtxids")
+
+        return errors, total_weight, total_fee
+
+
+def main(paths):
+    with BlockVerifier() as verifier:
+        failed = False
+        for path in paths or [OUTPUT_FILE]:
+            errors, total_weight, total_fee = verifier.verify(path)
+            for error in errors:
+                print(f"{path}: {error}")
+            if errors:
+                failed = True
+            else:
+                print(f"{path}: block is valid with a total weight of {total_weight} and a total fee of {total_fee}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))